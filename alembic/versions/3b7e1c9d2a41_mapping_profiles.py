@@ -0,0 +1,46 @@
+"""mapping profiles
+
+Revision ID: 3b7e1c9d2a41
+Revises: fad3cba3e21f
+Create Date: 2026-10-19 09:12:31.482911
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b7e1c9d2a41'
+down_revision: Union[str, None] = 'fad3cba3e21f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('mapping_profiles',
+        sa.Column('profile_name', sa.String(), nullable=False),
+        sa.Column('col_mapping', sa.JSON(), nullable=False),
+        sa.Column('namespaces', sa.JSON(), nullable=False),
+        sa.Column('construct_query', sa.String(), nullable=True),
+        sa.Column('company_id', sa.Integer(), nullable=False),
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('uuid', sa.String(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['company_id'], ['core.companies.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('uuid'),
+        schema='compliance'
+    )
+    op.create_index(op.f('ix_compliance_mapping_profiles_company_id'), 'mapping_profiles', ['company_id'], unique=False, schema='compliance')
+    op.create_index(op.f('ix_compliance_mapping_profiles_id'), 'mapping_profiles', ['id'], unique=True, schema='compliance')
+    op.create_index(op.f('ix_compliance_mapping_profiles_profile_name'), 'mapping_profiles', ['profile_name'], unique=False, schema='compliance')
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_compliance_mapping_profiles_profile_name'), table_name='mapping_profiles', schema='compliance')
+    op.drop_index(op.f('ix_compliance_mapping_profiles_id'), table_name='mapping_profiles', schema='compliance')
+    op.drop_index(op.f('ix_compliance_mapping_profiles_company_id'), table_name='mapping_profiles', schema='compliance')
+    op.drop_table('mapping_profiles', schema='compliance')
@@ -0,0 +1,35 @@
+"""keyset pagination indexes
+
+Revision ID: 8f2d6a0c4b17
+Revises: 3b7e1c9d2a41
+Create Date: 2026-10-19 11:04:52.217630
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8f2d6a0c4b17'
+down_revision: Union[str, None] = '3b7e1c9d2a41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+TABLES = ('checks', 'connectors', 'mapping_profiles')
+
+
+def upgrade() -> None:
+    # The composite indexes serve the company filter and the ordering of the
+    # pages, which makes the single column indexes redundant
+    for table in TABLES:
+        op.create_index(f'ix_compliance_{table}_company_id_id', table, ['company_id', 'id'], unique=False, schema='compliance')
+        op.drop_index(f'ix_compliance_{table}_company_id', table_name=table, schema='compliance')
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.create_index(f'ix_compliance_{table}_company_id', table, ['company_id'], unique=False, schema='compliance')
+        op.drop_index(f'ix_compliance_{table}_company_id_id', table_name=table, schema='compliance')
@@ -0,0 +1,109 @@
+"""canonical hosted rules
+
+Revision ID: c5a9e3f17d20
+Revises: 8f2d6a0c4b17
+Create Date: 2026-10-19 13:37:08.904215
+
+"""
+import hashlib
+from typing import Optional, Sequence, Union
+
+from alembic import op
+import rdflib
+from rdflib.compare import to_canonical_graph
+from rdflib.namespace import RDF, SH
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5a9e3f17d20'
+down_revision: Union[str, None] = '8f2d6a0c4b17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# A frozen copy of api.utils.rules.canonicalize_rule at this revision, so
+# later changes to the app don't change what this migration writes
+def count_shapes(graph: rdflib.Graph)->int:
+    shapes = set(graph.subjects(RDF.type, SH.NodeShape))
+    shapes.update(graph.subjects(RDF.type, SH.PropertyShape))
+    shapes.update(graph.objects(None, SH.property))
+    for target in (SH.targetClass, SH.targetNode, SH.targetSubjectsOf, SH.targetObjectsOf):
+        shapes.update(graph.subjects(target, None))
+    return len(shapes)
+
+
+def canonicalize_rule(rule: str)->Optional[dict]:
+    try:
+        graph = rdflib.Graph()
+        graph.parse(data=rule, format='turtle')
+    except Exception:
+        return None
+
+    shape_count = count_shapes(graph)
+    if not shape_count:
+        return None
+
+    lines = to_canonical_graph(graph).serialize(format='nt').splitlines()
+    ntriples = '\n'.join(sorted(line for line in lines if line)) + '\n'
+
+    default_namespaces = dict(rdflib.Graph().namespaces())
+    namespaces = {
+        prefix: str(uri) for prefix, uri in graph.namespaces()
+        if default_namespaces.get(prefix) != uri
+    }
+
+    return {
+        'canonical_rule': ntriples,
+        'rule_namespaces': namespaces,
+        'rule_hash': hashlib.sha256(ntriples.encode()).hexdigest(),
+        'rule_triple_count': len(graph),
+        'rule_shape_count': shape_count,
+    }
+
+
+def upgrade() -> None:
+    op.add_column('checks', sa.Column('canonical_rule', sa.Text(), nullable=True), schema='compliance')
+    op.add_column('checks', sa.Column('rule_namespaces', sa.JSON(), nullable=True), schema='compliance')
+    op.add_column('checks', sa.Column('rule_hash', sa.String(length=64), nullable=True), schema='compliance')
+    op.add_column('checks', sa.Column('rule_triple_count', sa.Integer(), nullable=True), schema='compliance')
+    op.add_column('checks', sa.Column('rule_shape_count', sa.Integer(), nullable=True), schema='compliance')
+    op.create_index(op.f('ix_compliance_checks_rule_hash'), 'checks', ['rule_hash'], unique=False, schema='compliance')
+
+    # Canonicalize the existing hosted rules, invalid rules are left as they
+    # are and keep being parsed from Turtle
+    checks = sa.table(
+        'checks',
+        sa.column('id', sa.Integer()),
+        sa.column('rule_source', sa.String()),
+        sa.column('rule', sa.String()),
+        sa.column('canonical_rule', sa.Text()),
+        sa.column('rule_namespaces', sa.JSON()),
+        sa.column('rule_hash', sa.String()),
+        sa.column('rule_triple_count', sa.Integer()),
+        sa.column('rule_shape_count', sa.Integer()),
+        schema='compliance'
+    )
+    connection = op.get_bind()
+    hosted_checks = connection.execute(
+        sa.select(checks.c.id, checks.c.rule)
+        .where(sa.cast(checks.c.rule_source, sa.String()) == 'digichecks_hosted')
+    ).all()
+    for check_id, rule in hosted_checks:
+        canonical_rule = canonicalize_rule(rule or '')
+        if canonical_rule is None:
+            continue
+        connection.execute(
+            checks.update()
+            .where(checks.c.id == check_id)
+            .values(**canonical_rule)
+        )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_compliance_checks_rule_hash'), table_name='checks', schema='compliance')
+    op.drop_column('checks', 'rule_shape_count', schema='compliance')
+    op.drop_column('checks', 'rule_triple_count', schema='compliance')
+    op.drop_column('checks', 'rule_hash', schema='compliance')
+    op.drop_column('checks', 'rule_namespaces', schema='compliance')
+    op.drop_column('checks', 'canonical_rule', schema='compliance')
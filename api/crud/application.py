@@ -4,6 +4,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from api.models import Application
 from api.schemas import ApplicatitonInDBSchema
+from api.utils.principal_cache import invalidate_application_principal
 
 
 async def db_get_application(db: AsyncSession, client_id: str):
@@ -31,5 +32,6 @@ async def db_create_application(
     db.add(db_application)
     await db.commit()
     await db.refresh(db_application)
+    invalidate_application_principal(db_application.client_id)
 
     return db_application
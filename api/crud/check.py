@@ -1,10 +1,12 @@
+import asyncio
 import datetime as dt
 from fastapi import HTTPException, status
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from api.models import Check
-from api.schemas.app.check import CheckInSchema
+from api.models import Check, Connector
+from api.schemas.app.check import CheckInSchema, RuleSource
+from api.utils.rules import canonicalize_rule
 
 
 async def db_get_check(db: AsyncSession, uuid: str):
@@ -20,6 +22,23 @@ async def db_get_check(db: AsyncSession, uuid: str):
     return db_check
 
 
+async def set_canonical_rule(db_check: Check):
+    # Hosted rules are validated and canonicalized once, when they are saved
+    if db_check.rule_source == RuleSource.digichecks_hosted:
+        canonical_rule = await asyncio.to_thread(canonicalize_rule, db_check.rule)
+        db_check.canonical_rule = canonical_rule.ntriples
+        db_check.rule_namespaces = canonical_rule.namespaces
+        db_check.rule_hash = canonical_rule.rule_hash
+        db_check.rule_triple_count = canonical_rule.triple_count
+        db_check.rule_shape_count = canonical_rule.shape_count
+    else:
+        db_check.canonical_rule = None
+        db_check.rule_namespaces = None
+        db_check.rule_hash = None
+        db_check.rule_triple_count = None
+        db_check.rule_shape_count = None
+
+
 async def db_create_check(
         db: AsyncSession, check: CheckInSchema, company_id: int, connector_id: int=None):
     db_check = Check(
@@ -30,6 +49,7 @@ async def db_create_check(
         connector_id=connector_id if connector_id else None,
         updated_at=dt.datetime.now()
     )
+    await set_canonical_rule(db_check)
 
     db.add(db_check)
     await db.commit()
@@ -42,6 +62,7 @@ async def db_update_check(db: AsyncSession, db_check: Check, check_in: CheckInSc
     for field, value in check_in.model_dump().items():
         if value:
             setattr(db_check, field, value)
+    await set_canonical_rule(db_check)
 
     db_check.updated_at = dt.datetime.now()
     await db.commit()
@@ -55,8 +76,20 @@ async def db_delete_check(db: AsyncSession, check: Check):
     return None
 
 
-async def db_get_all_checks(db: AsyncSession, company_id: int):
-    statement = select(Check).where(Check.company_id == company_id)
+async def db_get_all_checks(
+        db: AsyncSession, company_id: int, after_id: int=None, limit: int=None):
+    # The connector uuids are joined in, instead of a query per check
+    statement = (
+        select(Check, Connector.uuid.label('connector_uuid'))
+        .outerjoin(Connector, Check.connector_id == Connector.id)
+        .where(Check.company_id == company_id)
+        .order_by(Check.id)
+    )
+    if after_id is not None:
+        statement = statement.where(Check.id > after_id)
+    if limit is not None:
+        statement = statement.limit(limit)
+
     result = await db.execute(statement)
-    db_checks = result.scalars().all()
+    db_checks = result.all()
     return db_checks
@@ -5,6 +5,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from api.models import Company
 from api.schemas import CompanyInSchema
+from api.utils.principal_cache import invalidate_company_principals
 
 
 async def db_get_company(db: AsyncSession, uuid: str):
@@ -38,12 +39,14 @@ async def db_update_company(db: AsyncSession, db_company: Company, company_in: C
     db_company.updated_at = dt.datetime.now()
     await db.commit()
     await db.refresh(db_company)
+    invalidate_company_principals(db_company.uuid)
     return db_company
 
 
 async def db_delete_company(db: AsyncSession, company: Company):
     await db.delete(company)
     await db.commit()
+    invalidate_company_principals(company.uuid)
     return None
 
 
@@ -72,8 +72,18 @@ async def db_delete_connector(db: AsyncSession, connector: Connector):
     return None
 
 
-async def db_get_all_connectors(db: AsyncSession, company_id: int):
-    statement = select(Connector).where(Connector.company_id == company_id)
+async def db_get_all_connectors(
+        db: AsyncSession, company_id: int, after_id: int=None, limit: int=None):
+    statement = (
+        select(Connector)
+        .where(Connector.company_id == company_id)
+        .order_by(Connector.id)
+    )
+    if after_id is not None:
+        statement = statement.where(Connector.id > after_id)
+    if limit is not None:
+        statement = statement.limit(limit)
+
     result = await db.execute(statement)
     db_connectors = result.scalars().all()
     return db_connectors
@@ -0,0 +1,78 @@
+import datetime as dt
+from fastapi import HTTPException, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.models import MappingProfile
+from api.schemas.app.mapping_profile import (
+    MappingProfileInSchema,
+    MappingProfileUpdateSchema
+)
+
+
+async def db_get_mapping_profile(db: AsyncSession, uuid: str, company_id: int):
+    # Profiles of other companies are not found
+    statement = select(MappingProfile).where(
+        MappingProfile.uuid == uuid, MappingProfile.company_id == company_id)
+    result = await db.execute(statement)
+    db_profile = result.scalars().one_or_none()
+
+    if db_profile is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail='No mapping profile was found with that id.'
+        )
+    return db_profile
+
+
+async def db_create_mapping_profile(
+        db: AsyncSession, profile: MappingProfileInSchema, company_id: int):
+    db_profile = MappingProfile(
+        profile_name=profile.profile_name,
+        col_mapping=profile.col_mapping,
+        namespaces=profile.namespaces,
+        construct_query=profile.construct_query,
+        company_id=company_id,
+        updated_at=dt.datetime.now()
+    )
+
+    db.add(db_profile)
+    await db.commit()
+    await db.refresh(db_profile)
+
+    return db_profile
+
+
+async def db_update_mapping_profile(
+        db: AsyncSession, db_profile: MappingProfile, profile_in: MappingProfileUpdateSchema):
+    # Only the fields that were sent are updated
+    for field, value in profile_in.model_dump(exclude_unset=True).items():
+        setattr(db_profile, field, value)
+
+    db_profile.updated_at = dt.datetime.now()
+    await db.commit()
+    await db.refresh(db_profile)
+    return db_profile
+
+
+async def db_delete_mapping_profile(db: AsyncSession, profile: MappingProfile):
+    await db.delete(profile)
+    await db.commit()
+    return None
+
+
+async def db_get_all_mapping_profiles(
+        db: AsyncSession, company_id: int, after_id: int=None, limit: int=None):
+    statement = (
+        select(MappingProfile)
+        .where(MappingProfile.company_id == company_id)
+        .order_by(MappingProfile.id)
+    )
+    if after_id is not None:
+        statement = statement.where(MappingProfile.id > after_id)
+    if limit is not None:
+        statement = statement.limit(limit)
+
+    result = await db.execute(statement)
+    db_profiles = result.scalars().all()
+    return db_profiles
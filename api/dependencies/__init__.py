@@ -1,9 +1,10 @@
 from .config import settings
-from .database import get_db
+from .database import get_db, get_read_db
 from .security import (
     ApplicationRole,
     create_access_token, 
     super_user_level,
     company_admin_level,
     company_user_level
-)
\ No newline at end of file
+)
+from .profiling import request_profiler
@@ -1,4 +1,6 @@
+from enum import Enum
 import os
+from typing import Optional
 
 from pydantic_settings import BaseSettings
 from sqlalchemy import URL
@@ -6,6 +8,22 @@ from sqlalchemy import URL
 from api import __version__
 
 
+class ConversionEngine(str, Enum):
+    sparql_anything = 'sparql_anything'
+    native = 'native'
+
+
+class SharedCacheBackend(str, Enum):
+    none = 'none'
+    disk = 'disk'
+
+
+class TracingExporter(str, Enum):
+    none = 'none'
+    file = 'file'
+    otlp = 'otlp'
+
+
 class DataBaseSettings(BaseSettings):
     POSTGRES_HOST: str
     POSTGRES_PORT: str
@@ -28,6 +46,36 @@ class DataBaseSettings(BaseSettings):
             {'ssl': self.SSL_MODE})
         return url_object
 
+    # Optional read replica, with the credentials of the primary. Reads go to
+    # the primary while the replica lags more than READ_REPLICA_MAX_LAG
+    # seconds, and for that long after a client wrote to the primary.
+    READ_REPLICA_HOST: Optional[str] = None
+    READ_REPLICA_PORT: Optional[str] = None
+    READ_REPLICA_MAX_LAG: float = 5
+    READ_REPLICA_CHECK_INTERVAL: float = 1
+
+    @property
+    def READ_REPLICA_URL(self) -> Optional[URL]:
+        if not self.READ_REPLICA_HOST:
+            return None
+        return self.DATABASE_URL.set(
+            host=self.READ_REPLICA_HOST,
+            port=self.READ_REPLICA_PORT or self.POSTGRES_PORT
+        )
+
+
+    # Connection pool settings, per worker process. In PgBouncer mode
+    # (transaction pooling) prepared statements are not cached and get
+    # unique names, as server connections change between transactions.
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_RECYCLE: int = -1
+    DB_POOL_PRE_PING: bool = False
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    DB_PREPARED_STATEMENT_CACHE_SIZE: int = 100
+    DB_PGBOUNCER: bool = False
+
 
 class Settings(DataBaseSettings):
     # Application settings
@@ -38,10 +86,70 @@ class Settings(DataBaseSettings):
     JWT_ALGORITHM: str = 'HS256'
     JWT_ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     JWT_SECRET_KEY: str
+    PRINCIPAL_CACHE_TTL: int = 60
+    PRINCIPAL_CACHE_MAX_SIZE: int = 10000
+
+    # Token settings, tokens issued per client and failed token requests
+    # per client and address are limited per window
+    HASH_WORKERS: int = 2
+    VERIFIED_SECRET_CACHE_TTL: int = 300
+    VERIFIED_SECRET_CACHE_MAX_SIZE: int = 10000
+    TOKEN_RATE_LIMIT: int = 30
+    TOKEN_FAILURE_RATE_LIMIT: int = 10
+    TOKEN_RATE_WINDOW: int = 60
 
     # Crypto settings
     FERNET_KEY: str
 
+    # Data space settings
+    DSPACE_DOWNLOAD_CHUNK_SIZE: int = 1024 * 1024
+    DSPACE_SPOOL_MAX_MEMORY: int = 16 * 1024 * 1024
+    DSPACE_MAX_DOWNLOAD_SIZE: int = 2 * 1024 * 1024 * 1024
+    DSPACE_MAX_CONCURRENCY: int = 8
+
+    # Check data settings, limits the decompressed size of RDF bodies
+    RDF_SPOOL_MAX_MEMORY: int = 16 * 1024 * 1024
+    RDF_MAX_BODY_SIZE: int = 2 * 1024 * 1024 * 1024
+
+    # Parsed hosted rules kept per worker, by content hash. The shape target
+    # index leaves the shapes that can't match a data graph out of its
+    # validation.
+    RULE_CACHE_SIZE: int = 128
+    SHAPE_TARGET_INDEX: bool = True
+
+    # Cache shared by the workers on a node, for fetched rules, converted
+    # data sets and validation results. The disk backend uses /dev/shm
+    # when SHARED_CACHE_DIR is not set.
+    SHARED_CACHE_BACKEND: SharedCacheBackend = SharedCacheBackend.none
+    SHARED_CACHE_DIR: Optional[str] = None
+    SHARED_CACHE_MAX_SIZE: int = 512 * 1024 * 1024
+    SHARED_CACHE_API_RULE_TTL: int = 60
+
+    # Request tracing, the spans are returned in the Server-Timing header
+    # and optionally exported as OTLP JSON to a collector or a local file
+    TRACING_ENABLED: bool = False
+    TRACING_EXPORTER: TracingExporter = TracingExporter.none
+    TRACING_OTLP_ENDPOINT: str = 'http://localhost:4318/v1/traces'
+    TRACING_FILE_PATH: str = 'traces.jsonl'
+
+    # Responses from this size are compressed with zstd, brotli or gzip,
+    # whichever the client prefers and is installed
+    COMPRESSION_MIN_SIZE: int = 1024
+
+    # Profiles of requests sent with X-Profile: true by super users, the
+    # newest are kept in PROFILE_DIR or a temporary directory
+    PROFILE_DIR: Optional[str] = None
+    PROFILE_MAX_FILES: int = 100
+
+    # Conversion settings, without workers every conversion starts a JVM
+    CONVERSION_ENGINE: ConversionEngine = ConversionEngine.sparql_anything
+    SPARQL_ANYTHING_WORKERS: int = 0
+    SPARQL_ANYTHING_STARTUP_TIMEOUT: int = 60
+    SPARQL_ANYTHING_QUERY_TIMEOUT: int = 300
+    CONVERSION_TEMP_DIR: Optional[str] = None
+    EXCEL_STREAMING: bool = False
+    EXCEL_CHUNK_SIZE: int = 10000
+
 
 def get_settings():
     if '.env' in os.listdir():
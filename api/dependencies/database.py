@@ -1,30 +1,254 @@
-from dataclasses import dataclass
+import asyncio
+from dataclasses import asdict, dataclass, field
+import logging
+import threading
+import time
+from typing import Optional
 import uuid
 
-from sqlalchemy import event, String, Column, DateTime, Integer, func
+from fastapi import Depends, Request
+from jose import JWTError, jwt
+from sqlalchemy import event, exc, text, String, Column, DateTime, Integer, func
 from sqlalchemy.ext.asyncio import (
     AsyncSession,
     async_sessionmaker, 
     create_async_engine
 )
-from sqlalchemy.orm import DeclarativeBase, mapper
+from sqlalchemy.orm import DeclarativeBase, Session, mapper
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from api.dependencies.config import settings
+from api.utils.tracing import end_span, start_span
+from api.utils.ttl_cache import TTLCache
 
 
-engine = create_async_engine(settings.DATABASE_URL)
+@dataclass
+class PoolStats:
+    checkouts: int = 0
+    waits: int = 0
+    timeouts: int = 0
+    checkout_seconds_total: float = 0
+    checkout_seconds_max: float = 0
+
+
+# Times every checkout, a checkout waits when no connection is idle and the
+# overflow is used up
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    _stats_lock = threading.Lock()
+
+    def __init__(self, *args, max_overflow: int=10, **kwargs) -> None:
+        super().__init__(*args, max_overflow=max_overflow, **kwargs)
+        self.max_overflow = max_overflow
+        self.stats = PoolStats()
+
+    def recreate(self)->'InstrumentedQueuePool':
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+    def _do_get(self):
+        waits = (
+            self.max_overflow > -1
+            and self.overflow() >= self.max_overflow
+            and self.checkedin() == 0
+        )
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.stats.timeouts += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._stats_lock:
+                self.stats.checkouts += 1
+                self.stats.waits += waits
+                self.stats.checkout_seconds_total += elapsed
+                self.stats.checkout_seconds_max = max(
+                    self.stats.checkout_seconds_max, elapsed)
+
+
+def get_engine_options()->dict:
+    connect_args = {
+        'statement_cache_size': settings.DB_STATEMENT_CACHE_SIZE,
+        'prepared_statement_cache_size': settings.DB_PREPARED_STATEMENT_CACHE_SIZE,
+    }
+    if settings.DB_PGBOUNCER:
+        connect_args = {
+            'statement_cache_size': 0,
+            'prepared_statement_cache_size': 0,
+            'prepared_statement_name_func': lambda: f'__asyncpg_{uuid.uuid4()}__',
+        }
+
+    return {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': settings.DB_POOL_SIZE,
+        'max_overflow': settings.DB_MAX_OVERFLOW,
+        'pool_timeout': settings.DB_POOL_TIMEOUT,
+        'pool_recycle': settings.DB_POOL_RECYCLE,
+        'pool_pre_ping': settings.DB_POOL_PRE_PING,
+        'connect_args': connect_args,
+    }
+
+
+logger = logging.getLogger(__name__)
+
+
+# Sessions of the primary know the client they serve, so a client that
+# committed reads its own writes from the primary
+class PrimarySession(Session):
+    pass
+
+
+@event.listens_for(PrimarySession, 'after_commit')
+def receive_after_commit(session):
+    client_key = session.info.get('client_key')
+    if client_key is not None and replica_engine is not None:
+        replica_state.writes.set(client_key, True)
+
+
+engine = create_async_engine(settings.DATABASE_URL, **get_engine_options())
 async_session = async_sessionmaker(
-    bind=engine, class_=AsyncSession, expire_on_commit=False)
+    bind=engine,
+    class_=AsyncSession,
+    sync_session_class=PrimarySession,
+    expire_on_commit=False
+)
+
+replica_engine = None
+replica_session = None
+if settings.READ_REPLICA_URL is not None:
+    replica_engine = create_async_engine(
+        settings.READ_REPLICA_URL, **get_engine_options())
+    replica_session = async_sessionmaker(
+        bind=replica_engine, class_=AsyncSession, expire_on_commit=False)
+
+
+# Every statement is a span of the request trace. SQLAlchemy runs the events
+# in a greenlet that shares the context of the request.
+def receive_before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._trace_span = start_span('db', statement=(statement.split(None, 1) or [''])[0])
+
+
+def receive_after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    end_span(getattr(context, '_trace_span', None))
+
 
+for traced_engine in (engine, replica_engine):
+    if traced_engine is not None:
+        event.listen(
+            traced_engine.sync_engine, 'before_cursor_execute', receive_before_cursor_execute)
+        event.listen(
+            traced_engine.sync_engine, 'after_cursor_execute', receive_after_cursor_execute)
 
-async def get_db():
+
+@dataclass
+class ReplicaState:
+    healthy: bool = False
+    lag: Optional[float] = None
+    checked_at: float = float('-inf')
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    # Clients that wrote to the primary within the maximum lag
+    writes: TTLCache[bool] = field(default_factory=lambda: TTLCache(
+        maxsize=10000, ttl=settings.READ_REPLICA_MAX_LAG))
+
+
+replica_state = ReplicaState()
+
+REPLICA_LAG_QUERY = text(
+    'SELECT COALESCE(CASE '
+    'WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) '
+    'END, 0)'
+)
+
+
+def get_pool_stats()->dict:
+    def stats(pool: InstrumentedQueuePool, max_overflow: int)->dict:
+        return {
+            **asdict(pool.stats),
+            'size': pool.size(),
+            'in_use': pool.checkedout(),
+            'idle': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0),
+            'max_overflow': max_overflow,
+        }
+
+    pool_stats = stats(engine.sync_engine.pool, settings.DB_MAX_OVERFLOW)
+    if replica_engine is not None:
+        pool_stats['replica'] = {
+            **stats(replica_engine.sync_engine.pool, settings.DB_MAX_OVERFLOW),
+            'healthy': replica_state.healthy,
+            'lag': replica_state.lag,
+        }
+    return pool_stats
+
+
+def get_client_key(request: Request)->Optional[str]:
+    # Only used to route reads, the token is verified by the access levels
+    authorization = request.headers.get('Authorization', '')
+    scheme, _, token = authorization.partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return None
+    try:
+        return jwt.get_unverified_claims(token).get('sub')
+    except JWTError:
+        return None
+
+
+async def check_replica()->bool:
+    # Checked at most once per interval per worker, concurrent requests
+    # use the last known state meanwhile
+    now = time.monotonic()
+    if (now - replica_state.checked_at < settings.READ_REPLICA_CHECK_INTERVAL
+            or replica_state.lock.locked()):
+        return replica_state.healthy
+
+    async with replica_state.lock:
+        replica_state.checked_at = now
+        try:
+            async with replica_engine.connect() as connection:
+                lag = (await connection.execute(REPLICA_LAG_QUERY)).scalar()
+        except (exc.SQLAlchemyError, OSError) as e:
+            if replica_state.healthy:
+                logger.warning(f'Read replica unavailable, reading from primary: {e}')
+            replica_state.healthy = False
+            replica_state.lag = None
+            return False
+
+        replica_state.lag = float(lag)
+        replica_state.healthy = replica_state.lag <= settings.READ_REPLICA_MAX_LAG
+        return replica_state.healthy
+
+
+async def get_db(request: Request):
     db = async_session()
+    db.info['client_key'] = get_client_key(request)
     try:
         yield db
     finally:
         await db.close()
 
 
+async def get_read_db(request: Request, db: AsyncSession=Depends(get_db)):
+    # Read only dependencies use the replica when it is configured, healthy
+    # and the client did not write recently, otherwise the request's primary
+    # session, which only connects when it is used
+    if (replica_engine is None
+            or replica_state.writes.get(get_client_key(request))
+            or not await check_replica()):
+        yield db
+        return
+
+    read_db = replica_session()
+    read_db.info['replica'] = True
+    try:
+        yield read_db
+    finally:
+        await read_db.close()
+
+
 class BaseModel(DeclarativeBase):
     __abstract__ = True
 
@@ -63,4 +287,5 @@ APP_SCHEMA = 'compliance'
 APPLICATION_TABLE = Table(CORE_SCHEMA, 'applications')
 COMPANY_TABLE = Table(CORE_SCHEMA, 'companies')
 CHECK_TABLE = Table(APP_SCHEMA, 'checks')
-CONNECTOR_TABLE = Table(APP_SCHEMA, 'connectors')
\ No newline at end of file
+CONNECTOR_TABLE = Table(APP_SCHEMA, 'connectors')
+MAPPING_PROFILE_TABLE = Table(APP_SCHEMA, 'mapping_profiles')
\ No newline at end of file
@@ -0,0 +1,51 @@
+import asyncio
+import uuid
+
+from fastapi import HTTPException, Request, Security, status
+
+from api.dependencies.security import company_user_level
+from api.schemas.core.application import ApplicationRole
+from api.utils.principal_cache import Principal
+from api.utils.profiling import (
+    ProfileSession,
+    end_profile_session,
+    save_profile,
+    start_profile_session
+)
+
+
+# Profiles the stages of a request that is sent with the X-Profile: true
+# header. Only super users may profile, the profiles contain customer data.
+# The route's access level dependency is reused, it is not resolved twice.
+async def request_profiler(
+    request: Request,
+    principal: Principal = Security(company_user_level)
+):
+    if request.headers.get('X-Profile', '').lower() not in ('1', 'true'):
+        yield
+        return
+
+    if principal.role != ApplicationRole.super_user:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail='Only super users can profile requests'
+        )
+
+    session = ProfileSession(
+        profile_id=uuid.uuid4().hex,
+        method=request.method,
+        path=request.url.path
+    )
+    token = start_profile_session(session)
+    if token is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail='Another request is being profiled, try again later'
+        )
+
+    request.state.profile_id = session.profile_id
+    try:
+        yield
+    finally:
+        end_profile_session(token)
+        await asyncio.to_thread(save_profile, session)
@@ -4,14 +4,18 @@ from typing import Tuple
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
+from sqlalchemy.exc import NoResultFound
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing_extensions import Annotated
 
 from api.crud.application import db_get_application
 from api.crud.companies import db_get_company_by_internal_id
-from api.dependencies.database import get_db
+from api.dependencies.database import async_session, get_read_db
 from api.dependencies.config import settings
 from api.schemas.core.application import ApplicationRole
+from api.utils.metrics import record_cache_lookup
+from api.utils.principal_cache import Principal, principal_cache
+from api.utils.tracing import trace_span
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='token')
@@ -25,7 +29,7 @@ class AccessRightsLevel:
     @staticmethod
     async def get_current_application(
         token: Annotated[str, Depends(oauth2_scheme)], 
-        db: AsyncSession = Depends(get_db)
+        db: AsyncSession = Depends(get_read_db)
     ):
         credentials_exception = HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -48,6 +52,49 @@ class AccessRightsLevel:
             raise credentials_exception
         return application
 
+    @classmethod
+    async def load_principal(cls, token: str, db: AsyncSession)->Principal:
+        application = await cls.get_current_application(token, db)
+        db_company = await db_get_company_by_internal_id(db, application.company_id)
+        return Principal(
+            client_id=str(application.client_id),
+            role=application.role,
+            company_id=application.company_id,
+            company_uuid=db_company.uuid
+        )
+
+    @classmethod
+    async def get_current_principal(
+        cls,
+        token: Annotated[str, Depends(oauth2_scheme)],
+        db: AsyncSession = Depends(get_read_db)
+    )->Principal:
+        # Only the signature and expiry are checked for cached principals,
+        # so hot clients don't need a database round trip
+        try:
+            payload = jwt.decode(
+                token,
+                settings.JWT_SECRET_KEY,
+                algorithms=[settings.JWT_ALGORITHM]
+            )
+        except JWTError:
+            payload = {}
+        principal = principal_cache.get(payload.get('sub'))
+        record_cache_lookup('principals', principal is not None)
+        if principal is not None:
+            return principal
+
+        try:
+            principal = await cls.load_principal(token, db)
+        except (HTTPException, NoResultFound):
+            if not db.info.get('replica'):
+                raise
+            # New applications may not have reached the replica yet
+            async with async_session() as primary_db:
+                principal = await cls.load_principal(token, primary_db)
+        principal_cache.set(payload['sub'], principal)
+        return principal
+
     def has_required_level(self, role: ApplicationRole)->bool:
         role_hierarchy = {
             ApplicationRole.super_user: 100,
@@ -59,8 +106,8 @@ class AccessRightsLevel:
         else:
             return role_hierarchy[role] >= role_hierarchy[self.required_level]
 
-    async def is_member_of_company(self, db, application, company_uuid: str)->bool:
-        if application.role == ApplicationRole.super_user:
+    def is_member_of_company(self, principal: Principal, company_uuid: str)->bool:
+        if principal.role == ApplicationRole.super_user:
             return True
         elif not company_uuid:
             raise HTTPException(
@@ -68,20 +115,18 @@ class AccessRightsLevel:
                 detail='No company_id in path, contact system admin'
             )
         else:
-            db_company = await db_get_company_by_internal_id(
-                db, application.company_id)
-            return db_company.uuid == company_uuid
+            return principal.company_uuid == company_uuid
 
     async def __call__(
         self,
         token: Annotated[str, Depends(oauth2_scheme)], 
-        db: AsyncSession = Depends(get_db),
+        db: AsyncSession = Depends(get_read_db),
         company_uuid: str=None,
     ):
-        application = await self.get_current_application(token, db)
+        with trace_span('auth'):
+            principal = await self.get_current_principal(token, db)
 
-        has_access_to_company = await self.is_member_of_company(
-            db, application, company_uuid)
+        has_access_to_company = self.is_member_of_company(principal, company_uuid)
         
         if not has_access_to_company:
             raise HTTPException(
@@ -89,13 +134,13 @@ class AccessRightsLevel:
                 detail='Not authorized'
             )
 
-        if not self.has_required_level(application.role):
+        if not self.has_required_level(principal.role):
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail='Not enough permissions'
             )
         else:
-            return application
+            return principal
 
 
 super_user_level = AccessRightsLevel(ApplicationRole.super_user)
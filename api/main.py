@@ -1,3 +1,5 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
 from api.dependencies.config import settings
@@ -7,13 +9,33 @@ from api.routers.company_router import router as companies_router
 from api.routers.check_router import check_router
 from api.routers.connector_router import connector_router
 from api.routers.convertor_router import router as convertor_router
+from api.routers.mapping_profile_router import mapping_profile_router
+from api.routers.metrics_router import router as metrics_router
+from api.routers.status_router import router as status_router
+from api.utils.compression import CompressionMiddleware
+from api.utils.metrics import RequestMetricsMiddleware
+from api.utils.profiling import ProfileHeaderMiddleware
+from api.utils.sparql_anything import shutdown_sparql_anything_pool
+from api.utils.tracing import TracingMiddleware
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    shutdown_sparql_anything_pool()
 
 
 app = FastAPI(
     title=settings.APP_NAME,
     version=settings.APP_VERSION,
+    lifespan=lifespan,
 )
 
+app.add_middleware(CompressionMiddleware, minimum_size=settings.COMPRESSION_MIN_SIZE)
+app.add_middleware(RequestMetricsMiddleware)
+app.add_middleware(TracingMiddleware)
+app.add_middleware(ProfileHeaderMiddleware)
+
 
 tags_metadata = [
     {
@@ -36,9 +58,17 @@ tags_metadata = [
         'name': 'API Connector', 
         'description': 'Requests to create, read, update and delete API connectors'
     },
+    {
+        'name': 'Mapping Profile', 
+        'description': 'Requests to create, read, update and delete mapping profiles'
+    },
     {
         'name': 'Convertors', 
         'description': 'Convert specific datasets to JSON-LD'
+    },
+    {
+        'name': 'Status', 
+        'description': 'Runtime statistics of the service'
     }
 ]
 
@@ -54,5 +84,10 @@ app.include_router(
     check_router, prefix='/company/{company_uuid}/check', tags=['Check'])
 app.include_router(
     connector_router, prefix='/company/{company_uuid}/connector', tags=['API Connector'])
+app.include_router(
+    mapping_profile_router, prefix='/company/{company_uuid}/mapping-profile', tags=['Mapping Profile'])
 app.include_router(
     convertor_router, prefix='/company/{company_uuid}/convert', tags=['Convert Excel to JSON-LD'])
+app.include_router(
+    status_router, prefix='/status', tags=['Status'])
+app.include_router(metrics_router)
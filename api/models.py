@@ -1,6 +1,6 @@
 from cryptography.fernet import Fernet
 import rdflib
-from sqlalchemy import Column, String, Integer, ForeignKey, UUID
+from sqlalchemy import Column, String, Integer, ForeignKey, Index, JSON, Text, UUID
 from sqlalchemy import Enum as SQLAlchemyEnum
 
 from api.dependencies.database import (
@@ -9,10 +9,12 @@ from api.dependencies.database import (
     CHECK_TABLE, 
     COMPANY_TABLE,
     CONNECTOR_TABLE,
+    MAPPING_PROFILE_TABLE,
 )
 from api.schemas.app.check import RuleSource
 from api.schemas.core.application import ApplicationRole
 from api.dependencies import settings
+from api.utils.rules import load_canonical_rule
 
 
 class Company(BaseModel):
@@ -44,13 +46,24 @@ class Application(BaseModel):
 
 class Check(BaseModel):
     __tablename__ = CHECK_TABLE.table_name
-    __table_args__ = {'schema': CHECK_TABLE.schema_name}
+    __table_args__ = (
+        # Supports the keyset pagination of the company's checks
+        Index('ix_compliance_checks_company_id_id', 'company_id', 'id'),
+        {'schema': CHECK_TABLE.schema_name},
+    )
     __id_prefix__ = 'ch'
 
     check_name = Column(String, index=True, nullable=False)
     rule_source = Column(SQLAlchemyEnum(RuleSource), nullable=False)
     rule = Column(String)
 
+    # Canonical form of hosted rules, set when the check is saved
+    canonical_rule = Column(Text, nullable=True)
+    rule_namespaces = Column(JSON, nullable=True)
+    rule_hash = Column(String(64), index=True, nullable=True)
+    rule_triple_count = Column(Integer, nullable=True)
+    rule_shape_count = Column(Integer, nullable=True)
+
     # Foreign Keys
     connector_id = Column(
         Integer, 
@@ -60,12 +73,16 @@ class Check(BaseModel):
     company_id = Column(
         Integer,
         ForeignKey(COMPANY_TABLE.identifier),
-        index=True,
         nullable=False
     )
 
     @property
     def initialised_ttl_rule(self)->rdflib.Graph:
+        if self.rule_hash:
+            return load_canonical_rule(
+                self.rule_hash, self.canonical_rule, self.rule_namespaces)
+
+        # Rules that were saved before they were canonicalized
         graph = rdflib.Graph()
         graph.parse(data=self.rule, format='turtle')
         return graph
@@ -73,7 +90,11 @@ class Check(BaseModel):
 #TODO: Reset migrations and re-run them!!!
 class Connector(BaseModel):
     __tablename__ = CONNECTOR_TABLE.table_name
-    __table_args__ = {'schema': CONNECTOR_TABLE.schema_name}
+    __table_args__ = (
+        # Supports the keyset pagination of the company's connectors
+        Index('ix_compliance_connectors_company_id_id', 'company_id', 'id'),
+        {'schema': CONNECTOR_TABLE.schema_name},
+    )
     __id_prefix__ = 'cn'
 
     connector_name = Column(String, index=False, nullable=False)
@@ -85,7 +106,6 @@ class Connector(BaseModel):
     company_id = Column(
         Integer,
         ForeignKey(COMPANY_TABLE.identifier),
-        index=True,
         nullable=False
     )
 
@@ -98,3 +118,26 @@ class Connector(BaseModel):
     def decrypt_password(self)->str:
         fernet = Fernet(settings.FERNET_KEY)
         return fernet.decrypt(self.password.encode()).decode()
+
+
+class MappingProfile(BaseModel):
+    __tablename__ = MAPPING_PROFILE_TABLE.table_name
+    __table_args__ = (
+        # Supports the keyset pagination of the company's mapping profiles
+        Index('ix_compliance_mapping_profiles_company_id_id', 'company_id', 'id'),
+        {'schema': MAPPING_PROFILE_TABLE.schema_name},
+    )
+    __id_prefix__ = 'mp'
+
+    profile_name = Column(String, index=True, nullable=False)
+    col_mapping = Column(JSON, nullable=False)
+    namespaces = Column(JSON, nullable=False)
+    # Without a construct query the built-in supply point mapping is used
+    construct_query = Column(String, nullable=True)
+
+    # Foreign Keys
+    company_id = Column(
+        Integer,
+        ForeignKey(COMPANY_TABLE.identifier),
+        nullable=False
+    )
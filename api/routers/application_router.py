@@ -12,7 +12,7 @@ from api.schemas import (
     ApplicatitonInDBSchema,
     ApplicationOutSchema
 )
-from api.utils.hash import hash_password
+from api.utils.hash import hash_password_async
 
 
 router = APIRouter()
@@ -41,7 +41,7 @@ async def create_application(
     application = ApplicatitonInDBSchema(
         company_id=db_company.id,
         client_id=client_id,
-        hashed_client_secret=hash_password(client_secret)
+        hashed_client_secret=await hash_password_async(client_secret)
     )
 
     db_application = await db_create_application(db, application)
@@ -1,17 +1,39 @@
 from datetime import timedelta
+import math
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from api.dependencies import create_access_token, get_db, settings
 from api.crud.application import db_get_application
 from api.utils.oauth_form import CustomOAuth2PasswordRequestForm
-from api.utils.hash import verify_password
+from api.utils.hash import verify_client_secret
+from api.utils.throttle import SlidingWindowThrottle
 from api.schemas import TokenSchema
 
 
 router = APIRouter()
 
+token_throttle = SlidingWindowThrottle(
+    limit=settings.TOKEN_RATE_LIMIT,
+    window=settings.TOKEN_RATE_WINDOW
+)
+# Failures are counted per client and address, so failed attempts from
+# elsewhere don't lock a client out
+failed_token_throttle = SlidingWindowThrottle(
+    limit=settings.TOKEN_FAILURE_RATE_LIMIT,
+    window=settings.TOKEN_RATE_WINDOW
+)
+
+
+def check_throttle(retry_after: float):
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail='Too many token requests, try again later',
+            headers={'Retry-After': str(math.ceil(retry_after))},
+        )
+
 
 @router.post(
     name='Get access token',
@@ -20,18 +42,34 @@ router = APIRouter()
     response_model=TokenSchema
 )
 async def get_token(
+    request: Request,
     form_data: CustomOAuth2PasswordRequestForm = Depends(),
     db: AsyncSession = Depends(get_db)
 ):
-    application = await db_get_application(db, form_data.client_id)
+    failure_key = (form_data.client_id, request.client.host if request.client else None)
+    check_throttle(failed_token_throttle.retry_after(failure_key))
 
-    if not verify_password(form_data.client_secret, application.hashed_client_secret):
+    try:
+        application = await db_get_application(db, form_data.client_id)
+        verified = await verify_client_secret(
+            form_data.client_id,
+            form_data.client_secret,
+            application.hashed_client_secret
+        )
+    except HTTPException:
+        failed_token_throttle.hit(failure_key)
+        raise
+    if not verified:
+        failed_token_throttle.hit(failure_key)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail='Incorrect client_id or client_secret',
             headers={'WWW-Authenticate': 'Bearer'},
         )
 
+    # Only tokens that would be issued count for the client
+    check_throttle(token_throttle.hit(form_data.client_id))
+
     access_token_expires = timedelta(minutes=settings.JWT_ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token, expire = create_access_token(
         data={'sub': str(application.client_id)}, expires_delta=access_token_expires
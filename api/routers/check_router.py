@@ -1,9 +1,8 @@
-from io import BytesIO
+import asyncio
 import time
 
-from fastapi import APIRouter, Depends, status, Security, HTTPException
-import pandas as pd
-import pyshacl
+from fastapi import APIRouter, Depends, status, Security, HTTPException, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
 import requests
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -12,12 +11,13 @@ from api.schemas.app.check import (
     CheckOutSchema,
     RuleSource,
     DataSchema,
-    DataSetType,
     DSpaceCheckSchema,
+    DSpaceBatchCheckSchema,
     CheckResultSchema
 )
 from api.dependencies.security import company_user_level
-from api.dependencies.database import get_db
+from api.dependencies.database import get_db, get_read_db
+from api.dependencies.profiling import request_profiler
 from api.crud.check import (
     db_create_check,
     db_get_all_checks,
@@ -28,11 +28,20 @@ from api.crud.check import (
 from api.crud.connector import db_get_connector, db_get_connector_by_internal_id
 from api.crud.companies import db_get_company
 from api.utils.api import get_ttl_rule
-from api.utils.convertors import dataframe_to_xml, xml_to_graph, graph_to_json_ld
+from api.utils.metrics import observe_stage
+from api.utils.pagination import PageParams
+from api.utils.shared_cache import cache_key
 from api.utils.check_helpers import (
+    RDF_MEDIA_TYPES,
     get_ttl_rule_based_on_rule,
-    get_dspace_dataset,
-    start_dspace_transfer_process
+    get_request_media_type,
+    spool_request_body,
+    parse_request_data,
+    get_cached_validation,
+    set_cached_validation,
+    run_dspace_dataset_check,
+    run_dspace_batch_check,
+    validate_data_graph
 )
 
 
@@ -91,30 +100,27 @@ async def create_check(
     path='/all',
     status_code=status.HTTP_200_OK,
     response_model=list[CheckOutSchema],
+    response_class=ORJSONResponse,
     dependencies=[Security(company_user_level)]
 )
 async def get_checks(
     company_uuid: str,
-    db: AsyncSession=Depends(get_db)
+    response: Response,
+    page: PageParams=Depends(),
+    db: AsyncSession=Depends(get_read_db)
 ):
     db_company = await db_get_company(db, company_uuid)
-    db_checks = await db_get_all_checks(db, db_company.id)
-
-    # Get the connectors to map the connector_id to the connector_uuid
-    db_connectors = [
-        await db_get_connector_by_internal_id(db, check.connector_id)
-        for check 
-        in db_checks 
-        if check.connector_id
-    ]
-    connector_map = {connector.id: connector.uuid for connector in db_connectors}
+    db_checks = await db_get_all_checks(
+        db, db_company.id, after_id=page.after_id, limit=page.fetch_limit)
+    db_checks = page.page(db_checks, response, lambda row: row.Check.id)
 
+    # Map the connector_id to the connector_uuid of the joined connector
     transformed_checks = [
         {
-            **check.__dict__,
-            'connector_id': connector_map.get(check.connector_id)
+            **row.Check.__dict__,
+            'connector_id': row.connector_uuid
         }
-        for check in db_checks
+        for row in db_checks
     ]
 
     return transformed_checks
@@ -130,7 +136,7 @@ async def get_checks(
 async def get_check(
     company_uuid: str,
     check_uuid: str,
-    db: AsyncSession=Depends(get_db)
+    db: AsyncSession=Depends(get_read_db)
 ):
     db_check = await db_get_check(db, check_uuid)
 
@@ -186,31 +192,50 @@ async def delete_check(
     path='/{check_uuid}/run',
     status_code=status.HTTP_200_OK,
     response_model=CheckResultSchema,
-    dependencies=[Security(company_user_level)]
+    response_class=ORJSONResponse,
+    dependencies=[Security(company_user_level), Depends(request_profiler)],
+    openapi_extra={
+        'requestBody': {
+            'required': True,
+            'description': (
+                'JSON-LD, Turtle, N-Triples or N-Quads, chosen by Content-Type '
+                'and optionally compressed with Content-Encoding: gzip'
+            ),
+            'content': {
+                'application/json': {'schema': DataSchema.model_json_schema()},
+                **{
+                    media_type: {'schema': {'type': 'string'}}
+                    for media_type in RDF_MEDIA_TYPES
+                }
+            }
+        }
+    }
 )
 async def run_check(
     company_uuid: str,
     check_uuid: str,
-    data: DataSchema,
+    request: Request,
     db: AsyncSession=Depends(get_db)
 ):
     db_check = await db_get_check(db, check_uuid)
-    ttl_rule = await get_ttl_rule_based_on_rule(db, db_check)
+    media_type = get_request_media_type(request)
+    body_file, body_digest = await spool_request_body(request)
+
+    # The same data against the same rule version gives the same result, so
+    # a result from any worker is reused before the rule and data are parsed
+    data_key = cache_key(media_type, body_digest)
+    cached_result = get_cached_validation(db_check.rule_hash, data_key)
+    if cached_result is not None:
+        body_file.close()
+        conforms, results_text = cached_result
+    else:
+        with body_file:
+            ttl_rule = await get_ttl_rule_based_on_rule(db, db_check)
+            data_graph = await parse_request_data(body_file, media_type)
 
-    conforms, results_graph, results_text = pyshacl.validate(
-        data_graph=data.as_ttl,
-        shacl_graph=ttl_rule,
-        ont_graph=ttl_rule,
-        inference='none', # none or rdfs
-        abort_on_first=False,
-        allow_infos=False,
-        allow_warnings=True,
-        meta_shacl=False,
-        advanced=True,
-        js=False,
-        debug=False,
-        serialize_report_graph='turtle'
-    )
+        conforms, results_text = validate_data_graph(
+            data_graph, ttl_rule, db_check.rule_hash)
+        set_cached_validation(db_check.rule_hash, data_key, conforms, results_text)
 
     check_result = CheckResultSchema(
         check_id=check_uuid,
@@ -226,7 +251,8 @@ async def run_check(
     path='/{check_uuid}/run/dspace',
     status_code=status.HTTP_200_OK,
     response_model=CheckResultSchema,
-    dependencies=[Security(company_user_level)]
+    response_class=ORJSONResponse,
+    dependencies=[Security(company_user_level), Depends(request_profiler)]
 )
 async def run_dspace_check(
     company_uuid: str,
@@ -237,55 +263,15 @@ async def run_dspace_check(
     db_check = await db_get_check(db, check_uuid)
     ttl_rule = await get_ttl_rule_based_on_rule(db, db_check)
 
-    resp_transfer_process = start_dspace_transfer_process(
-        consumer_url='51.138.27.252:8181',
-        dataset_id=data.dataset_id
-    )
-
-    resp = get_dspace_dataset(
-        consumer_url='51.138.27.252:8183',
-        dataset_id=data.dataset_id
-    )
-
-    if data.data_set_type == DataSetType.EXCEL:
-        df = pd.read_excel(BytesIO(resp.content))
-
-        xml = dataframe_to_xml(
-            df=df,
-            col_mapping=data.col_mapping
-        )
-
-        turtle = xml_to_graph(
-            xml=xml,
-            namespaces=data.namespaces
-        )
-
-        json_ld = graph_to_json_ld(turtle)
-    
-    elif data.data_set_type == DataSetType.JSON_LD:
-        json_ld = resp.json()
-
-    else:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail='Data set type must be either excel or JSON-LD'
-        )
-
-    data_schema = DataSchema(**json_ld)
-
-    conforms, results_graph, results_text = pyshacl.validate(
-        data_graph=data_schema.as_ttl,
-        shacl_graph=ttl_rule,
-        ont_graph=ttl_rule,
-        inference='none', # none or rdfs
-        abort_on_first=False,
-        allow_infos=False,
-        allow_warnings=True,
-        meta_shacl=False,
-        advanced=True,
-        js=False,
-        debug=False,
-        serialize_report_graph='turtle'
+    conforms, results_text = await asyncio.to_thread(
+        run_dspace_dataset_check,
+        dataset_id=data.dataset_id,
+        data_set_type=data.data_set_type,
+        ttl_rule=ttl_rule,
+        col_mapping=data.col_mapping,
+        namespaces=data.namespaces,
+        checksum=data.checksum,
+        rule_key=db_check.rule_hash
     )
 
     check_result = CheckResultSchema(
@@ -295,3 +281,34 @@ async def run_dspace_check(
         description=results_text
     )
     return check_result
+
+
+@check_router.post(
+    name='Run Data Space SHACL compliancy check on multiple data sets',
+    path='/{check_uuid}/run/dspace/batch',
+    status_code=status.HTTP_200_OK,
+    response_class=StreamingResponse,
+    responses={
+        status.HTTP_200_OK: {
+            'description': 'One JSON encoded check result per line, in order of completion',
+            'content': {'application/x-ndjson': {}}
+        }
+    },
+    dependencies=[Security(company_user_level)]
+)
+async def run_dspace_batch(
+    company_uuid: str,
+    check_uuid: str,
+    data: DSpaceBatchCheckSchema,
+    db: AsyncSession=Depends(get_db)
+):
+    db_check = await db_get_check(db, check_uuid)
+    ttl_rule = await get_ttl_rule_based_on_rule(db, db_check)
+
+    async def serialize_results():
+        async for result in run_dspace_batch_check(db_check, ttl_rule, data):
+            with observe_stage('report_serialization'):
+                line = result.model_dump_json() + '\n'
+            yield line
+
+    return StreamingResponse(serialize_results(), media_type='application/x-ndjson')
@@ -9,6 +9,7 @@ from api.crud.companies import (
 )
 from api.dependencies import (
     get_db,
+    get_read_db,
     super_user_level,
     company_admin_level, 
     company_user_level
@@ -28,7 +29,7 @@ router = APIRouter()
 )
 async def get_company(
     company_uuid: str,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     db_company = await db_get_company(db, company_uuid)
     return db_company
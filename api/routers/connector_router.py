@@ -1,9 +1,9 @@
-from fastapi import APIRouter, Depends, status, Security
+from fastapi import APIRouter, Depends, status, Security, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from api.schemas.app.connector import ConnectorInSchema, ConnectorOutSchema, ConnectorUpdateSchema
 from api.dependencies.security import company_user_level
-from api.dependencies.database import get_db
+from api.dependencies.database import get_db, get_read_db
 from api.crud.connector import (
     db_create_connector,
     db_get_connector,
@@ -12,6 +12,7 @@ from api.crud.connector import (
     db_get_all_connectors
 )
 from api.crud.companies import db_get_company
+from api.utils.pagination import PageParams
 
 
 connector_router = APIRouter()
@@ -44,11 +45,14 @@ async def create_connector(
 )
 async def get_checks(
     company_uuid: str,
-    db: AsyncSession=Depends(get_db)
+    response: Response,
+    page: PageParams=Depends(),
+    db: AsyncSession=Depends(get_read_db)
 ):
     db_company = await db_get_company(db, company_uuid)
-    db_checks = await db_get_all_connectors(db, db_company.id)
-    return db_checks
+    db_checks = await db_get_all_connectors(
+        db, db_company.id, after_id=page.after_id, limit=page.fetch_limit)
+    return page.page(db_checks, response, lambda connector: connector.id)
 
 
 @connector_router.get(
@@ -61,7 +65,7 @@ async def get_checks(
 async def get_connectors(
     company_uuid: str,
     connector_uuid: str,
-    db: AsyncSession=Depends(get_db)
+    db: AsyncSession=Depends(get_read_db)
 ):
     db_connector = await db_get_connector(db, connector_uuid)
     return db_connector
@@ -1,7 +1,9 @@
+import asyncio
 from io import BytesIO
+from typing import List
 
-from fastapi import APIRouter, Depends, status, Security, File, UploadFile
-import pandas as pd
+from fastapi import APIRouter, Depends, status, Security, File, Form, HTTPException, UploadFile
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from api.crud.companies import (
@@ -14,57 +16,184 @@ from api.dependencies import (
     get_db,
     super_user_level,
     company_admin_level, 
-    company_user_level
+    company_user_level,
+    request_profiler
 )
+from api.crud.mapping_profile import db_get_mapping_profile
 from api.schemas import CompanyInSchema, CompanyOutSchema
-from api.utils.convertors import dataframe_to_xml, xml_to_graph, graph_to_json_ld
+from api.schemas.app.check import CheckResultSchema, DataSetType
+from api.utils.check_helpers import run_checks_on_graph
+from api.utils.convertors import convert_dataframe, stream_json_ld
+from api.utils.mapping_profiles import get_compiled_mapping_profile
+from api.utils.readers import read_data_set
 
 
 router = APIRouter()
 
 
+REALIA_ELECTRICITY_COL_MAPPING = {
+    'CGP': 'CGP',
+    'CGP Type': 'CGPType',
+    'LGA': 'LGA',
+    'Portal': 'Portal',
+    'Planta': 'Planta',
+    'Mano': 'Mano',
+    'Supply Point Name': 'SupplyPointName',
+    'Tipo Suministro': 'Tipo',
+    'Potencia': 'Potencia',
+    'Potencia Simultanea': 'PotenciaSimultánea',
+}
+
+REALIA_ELECTRICITY_NAMESPACES = {
+    'ex': 'http://example.org/realia/dataset/',
+    'realia_otl': 'http://realia.es/realia-otl/',
+    'realia_ds': 'http://realia-dataspace.org/data/',
+    'qudt': 'http://qudt.org/schema/qudt/',
+    'sml': 'https://w3id.org/sml/def#',
+}
+
+
 @router.post(
     name='Convert Realia Electricity Excel to JSON-LD',
     path='/realia/electricity',
     status_code=status.HTTP_201_CREATED,
-    dependencies=[Security(company_user_level)]
+    dependencies=[Security(company_user_level), Depends(request_profiler)]
 )
 async def convert_electricity_excel(
     file: UploadFile,
+    data_set_type: DataSetType = DataSetType.EXCEL,
     db: AsyncSession = Depends(get_db)
 ):
     try:
-        df = pd.read_excel(file.file)
+        df = await asyncio.to_thread(
+            read_data_set, file.file, data_set_type, REALIA_ELECTRICITY_COL_MAPPING.keys())
     except Exception as e:
-        return {'message': f'Error reading Excel file: {e}'}
+        return {'message': f'Error reading {data_set_type.value} file: {e}'}
     
-    xml = dataframe_to_xml(
+    # Convert off the event loop, so parallel conversions don't block each other
+    turtle = await asyncio.to_thread(
+        convert_dataframe,
         df=df,
-        col_mapping={
-            'CGP': 'CGP',
-            'CGP Type': 'CGPType',
-            'LGA': 'LGA',
-            'Portal': 'Portal',
-            'Planta': 'Planta',
-            'Mano': 'Mano',
-            'Supply Point Name': 'SupplyPointName',
-            'Tipo Suministro': 'Tipo',
-            'Potencia': 'Potencia',
-            'Potencia Simultanea': 'PotenciaSimultánea',
-        }
+        col_mapping=REALIA_ELECTRICITY_COL_MAPPING,
+        namespaces=REALIA_ELECTRICITY_NAMESPACES
     )
-    
-    turtle = xml_to_graph(
-        xml=xml,
-        namespaces={
-            'ex': 'http://example.org/realia/dataset/',
-            'realia_otl': 'http://realia.es/realia-otl/',
-            'realia_ds': 'http://realia-dataspace.org/data/',
-            'qudt': 'http://qudt.org/schema/qudt/',
-            'sml': 'https://w3id.org/sml/def#',
-        }
+
+    # Stream the JSON-LD node by node, large graphs are never encoded at once
+    return StreamingResponse(
+        stream_json_ld(turtle),
+        status_code=status.HTTP_201_CREATED,
+        media_type='application/json'
+    )
+
+
+@router.post(
+    name='Convert Realia Electricity Excel and run SHACL compliancy checks',
+    path='/realia/electricity/check',
+    status_code=status.HTTP_200_OK,
+    response_model=list[CheckResultSchema],
+    response_class=ORJSONResponse,
+    dependencies=[Security(company_user_level), Depends(request_profiler)]
+)
+async def convert_and_check_electricity_excel(
+    file: UploadFile,
+    check_ids: List[str] = Form(min_length=1),
+    data_set_type: DataSetType = DataSetType.EXCEL,
+    db: AsyncSession = Depends(get_db)
+):
+    # The converted graph is validated as is, without JSON-LD in between
+    try:
+        df = await asyncio.to_thread(
+            read_data_set, file.file, data_set_type, REALIA_ELECTRICITY_COL_MAPPING.keys())
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f'Error reading {data_set_type.value} file: {e}'
+        )
+
+    data_graph = await asyncio.to_thread(
+        convert_dataframe,
+        df=df,
+        col_mapping=REALIA_ELECTRICITY_COL_MAPPING,
+        namespaces=REALIA_ELECTRICITY_NAMESPACES
+    )
+
+    return await run_checks_on_graph(db, check_ids, data_graph)
+
+
+@router.post(
+    name='Convert Excel to JSON-LD with a Mapping Profile',
+    path='/{profile_uuid}',
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Security(company_user_level), Depends(request_profiler)]
+)
+async def convert_excel_with_mapping_profile(
+    company_uuid: str,
+    profile_uuid: str,
+    file: UploadFile,
+    data_set_type: DataSetType = DataSetType.EXCEL,
+    db: AsyncSession = Depends(get_db)
+):
+    # The profile is compiled once per version and cached per worker
+    db_company = await db_get_company(db, company_uuid)
+    db_profile = await db_get_mapping_profile(db, profile_uuid, db_company.id)
+    profile = get_compiled_mapping_profile(db_profile)
+
+    try:
+        df = await asyncio.to_thread(
+            read_data_set, file.file, data_set_type, profile.col_mapping.keys())
+    except Exception as e:
+        return {'message': f'Error reading {data_set_type.value} file: {e}'}
+
+    turtle = await asyncio.to_thread(
+        convert_dataframe,
+        df=df,
+        col_mapping=profile.col_mapping,
+        namespaces=profile.namespaces,
+        query_path=profile.query_path
     )
 
-    json_ld = graph_to_json_ld(turtle)
+    return StreamingResponse(
+        stream_json_ld(turtle),
+        status_code=status.HTTP_201_CREATED,
+        media_type='application/json'
+    )
+
+
+@router.post(
+    name='Convert Excel with a Mapping Profile and run SHACL compliancy checks',
+    path='/{profile_uuid}/check',
+    status_code=status.HTTP_200_OK,
+    response_model=list[CheckResultSchema],
+    response_class=ORJSONResponse,
+    dependencies=[Security(company_user_level), Depends(request_profiler)]
+)
+async def convert_and_check_with_mapping_profile(
+    company_uuid: str,
+    profile_uuid: str,
+    file: UploadFile,
+    check_ids: List[str] = Form(min_length=1),
+    data_set_type: DataSetType = DataSetType.EXCEL,
+    db: AsyncSession = Depends(get_db)
+):
+    db_company = await db_get_company(db, company_uuid)
+    db_profile = await db_get_mapping_profile(db, profile_uuid, db_company.id)
+    profile = get_compiled_mapping_profile(db_profile)
+
+    try:
+        df = await asyncio.to_thread(
+            read_data_set, file.file, data_set_type, profile.col_mapping.keys())
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f'Error reading {data_set_type.value} file: {e}'
+        )
+
+    data_graph = await asyncio.to_thread(
+        convert_dataframe,
+        df=df,
+        col_mapping=profile.col_mapping,
+        namespaces=profile.namespaces,
+        query_path=profile.query_path
+    )
 
-    return json_ld
+    return await run_checks_on_graph(db, check_ids, data_graph)
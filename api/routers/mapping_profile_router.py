@@ -0,0 +1,157 @@
+from fastapi import APIRouter, Depends, HTTPException, status, Security, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.schemas.app.mapping_profile import (
+    MappingProfileInSchema,
+    MappingProfileOutSchema,
+    MappingProfileUpdateSchema
+)
+from api.dependencies.security import company_admin_level, company_user_level
+from api.dependencies.database import get_db, get_read_db
+from api.crud.mapping_profile import (
+    db_create_mapping_profile,
+    db_get_mapping_profile,
+    db_update_mapping_profile,
+    db_delete_mapping_profile,
+    db_get_all_mapping_profiles
+)
+from api.crud.companies import db_get_company
+from api.utils.pagination import PageParams
+from api.utils.principal_cache import Principal
+from api.utils.mapping_profiles import (
+    compile_mapping_profile,
+    evict_compiled_mapping_profile,
+    get_compiled_mapping_profile
+)
+
+
+mapping_profile_router = APIRouter()
+
+
+def check_construct_query_access(principal: Principal):
+    # A construct query runs on the server, only admins may provide one
+    if not company_admin_level.has_required_level(principal.role):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail='Only company admins can set a construct query'
+        )
+
+
+@mapping_profile_router.post(
+    name='Create new Mapping Profile',
+    path='',
+    status_code=status.HTTP_201_CREATED,
+    response_model=MappingProfileOutSchema
+)
+async def create_mapping_profile(
+    company_uuid: str,
+    profile: MappingProfileInSchema,
+    db: AsyncSession=Depends(get_db),
+    principal: Principal=Security(company_user_level)
+):
+    if profile.construct_query:
+        check_construct_query_access(principal)
+
+    # Compile before saving, so invalid profiles are rejected up front
+    compile_mapping_profile(
+        col_mapping=profile.col_mapping,
+        namespaces=profile.namespaces,
+        construct_query=profile.construct_query
+    )
+
+    db_company = await db_get_company(db, company_uuid)
+    db_profile = await db_create_mapping_profile(db, profile, db_company.id)
+    get_compiled_mapping_profile(db_profile)
+
+    return db_profile
+
+
+@mapping_profile_router.get(
+    name='Get all mapping profiles',
+    path='/all',
+    status_code=status.HTTP_200_OK,
+    response_model=list[MappingProfileOutSchema],
+    dependencies=[Security(company_user_level)]
+)
+async def get_mapping_profiles(
+    company_uuid: str,
+    response: Response,
+    page: PageParams=Depends(),
+    db: AsyncSession=Depends(get_read_db)
+):
+    db_company = await db_get_company(db, company_uuid)
+    db_profiles = await db_get_all_mapping_profiles(
+        db, db_company.id, after_id=page.after_id, limit=page.fetch_limit)
+    return page.page(db_profiles, response, lambda profile: profile.id)
+
+
+@mapping_profile_router.get(
+    name='Get an existing Mapping Profile',
+    path='/{profile_uuid}',
+    status_code=status.HTTP_200_OK,
+    response_model=MappingProfileOutSchema,
+    dependencies=[Security(company_user_level)]
+)
+async def get_mapping_profile(
+    company_uuid: str,
+    profile_uuid: str,
+    db: AsyncSession=Depends(get_read_db)
+):
+    db_company = await db_get_company(db, company_uuid)
+    db_profile = await db_get_mapping_profile(db, profile_uuid, db_company.id)
+    return db_profile
+
+
+@mapping_profile_router.put(
+    name='Update Mapping Profile',
+    path='/{profile_uuid}',
+    status_code=status.HTTP_200_OK,
+    response_model=MappingProfileOutSchema
+)
+async def update_mapping_profile(
+    company_uuid: str,
+    profile_uuid: str,
+    profile: MappingProfileUpdateSchema,
+    db: AsyncSession=Depends(get_db),
+    principal: Principal=Security(company_user_level)
+):
+    if profile.construct_query:
+        check_construct_query_access(principal)
+
+    db_company = await db_get_company(db, company_uuid)
+    db_profile = await db_get_mapping_profile(db, profile_uuid, db_company.id)
+
+    # Compile the updated profile before it replaces the saved one, a
+    # construct query sent as null is cleared
+    if 'construct_query' in profile.model_fields_set:
+        construct_query = profile.construct_query
+    else:
+        construct_query = db_profile.construct_query
+    compile_mapping_profile(
+        col_mapping=profile.col_mapping or db_profile.col_mapping,
+        namespaces=profile.namespaces or db_profile.namespaces,
+        construct_query=construct_query
+    )
+
+    db_profile = await db_update_mapping_profile(db, db_profile, profile)
+    get_compiled_mapping_profile(db_profile)
+
+    return db_profile
+
+
+@mapping_profile_router.delete(
+    name='Delete Mapping Profile',
+    path='/{profile_uuid}',
+    status_code=status.HTTP_204_NO_CONTENT,
+    dependencies=[Security(company_user_level)]
+)
+async def delete_mapping_profile(
+    company_uuid: str,
+    profile_uuid: str,
+    db: AsyncSession=Depends(get_db)
+):
+    db_company = await db_get_company(db, company_uuid)
+    db_profile = await db_get_mapping_profile(db, profile_uuid, db_company.id)
+    await db_delete_mapping_profile(db, db_profile)
+    evict_compiled_mapping_profile(profile_uuid)
+    return None
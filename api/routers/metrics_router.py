@@ -0,0 +1,18 @@
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST
+
+from api.utils.metrics import generate_metrics
+
+
+router = APIRouter()
+
+
+# Scraped by Prometheus, which does not authenticate. Don't expose the path
+# outside the internal network.
+@router.get(
+    name='Get Prometheus metrics',
+    path='/metrics',
+    include_in_schema=False
+)
+async def get_metrics():
+    return Response(content=generate_metrics(), media_type=CONTENT_TYPE_LATEST)
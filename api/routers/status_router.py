@@ -0,0 +1,53 @@
+from fastapi import APIRouter, status, Security, HTTPException
+from fastapi.responses import FileResponse
+
+from api.dependencies import super_user_level
+from api.dependencies.database import get_pool_stats
+from api.utils.profiling import get_profile_path, list_profiles
+
+
+router = APIRouter()
+
+
+@router.get(
+    name='Get database connection pool statistics',
+    path='/database-pool',
+    status_code=status.HTTP_200_OK,
+    dependencies=[Security(super_user_level)]
+)
+async def get_database_pool_status():
+    # Statistics of this worker process only
+    return get_pool_stats()
+
+
+@router.get(
+    name='Get profiled requests',
+    path='/profiles',
+    status_code=status.HTTP_200_OK,
+    dependencies=[Security(super_user_level)]
+)
+async def get_profiles():
+    # Profiles of all workers on this node, newest first
+    return list_profiles()
+
+
+@router.get(
+    name='Download a request profile',
+    path='/profiles/{profile_id}',
+    status_code=status.HTTP_200_OK,
+    response_class=FileResponse,
+    dependencies=[Security(super_user_level)]
+)
+async def get_profile(profile_id: str):
+    # A pstats file, open it with python -m pstats or snakeviz
+    profile_path = get_profile_path(profile_id)
+    if profile_path is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail='Profile not found'
+        )
+    return FileResponse(
+        profile_path,
+        media_type='application/octet-stream',
+        filename=f'{profile_id}.pstats'
+    )
@@ -19,6 +19,8 @@ class CheckResult(str,Enum):
 
 class DataSetType(str,Enum):
     EXCEL = 'excel'
+    CSV = 'csv'
+    PARQUET = 'parquet'
     JSON_LD = 'JSON-LD'
 
 
@@ -35,6 +37,9 @@ class CheckOutSchema(BaseModel):
     rule_source: RuleSource
     rule: str
     connector_id: str=None
+    rule_hash: Optional[str] = None
+    rule_triple_count: Optional[int] = None
+    rule_shape_count: Optional[int] = None
 
     class Config:
         from_attributes = True
@@ -49,6 +54,12 @@ class CheckResultSchema(BaseModel):
     timestamp: dt.datetime = dt.datetime.now()
 
 
+class DSpaceCheckResultSchema(CheckResultSchema):
+    dataset_id: str
+    check_result: Optional[CheckResult] = None
+    error: Optional[str] = None
+
+
 class DataSchema(BaseModel):
     context: list = Field(alias='@context')
     graph: List[Any] = Field(alias='@graph')
@@ -66,6 +77,8 @@ class DSpaceCheckSchema(BaseModel):
     data_set_type: DataSetType
     col_mapping: Optional[dict[str,str]] = None
     namespaces: Optional[dict[str,str]] = None
+    checksum: Optional[str] = Field(
+        default=None, description='Expected SHA-256 hex digest of the dataset')
 
     @staticmethod
     def json_ld_to_ttl(json_ld)->str:
@@ -80,3 +93,14 @@ class DSpaceCheckSchema(BaseModel):
             )
 
         return ttl
+
+
+class DSpaceBatchCheckSchema(BaseModel):
+    dataset_ids: List[str] = Field(min_length=1)
+    data_set_type: DataSetType
+    col_mapping: Optional[dict[str,str]] = None
+    namespaces: Optional[dict[str,str]] = None
+    checksums: Optional[dict[str,str]] = Field(
+        default=None, description='Expected SHA-256 hex digest per dataset id')
+    concurrency: Optional[int] = Field(
+        default=None, ge=1, description='Number of data sets checked in parallel')
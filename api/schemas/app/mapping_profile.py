@@ -0,0 +1,30 @@
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+
+class MappingProfileInSchema(BaseModel):
+    profile_name: str
+    col_mapping: dict[str,str] = Field(min_length=1)
+    namespaces: dict[str,str] = {}
+    construct_query: Optional[str] = None
+
+
+class MappingProfileUpdateSchema(BaseModel):
+    profile_name: str=None
+    col_mapping: dict[str,str]=None
+    namespaces: dict[str,str]=None
+    # Sent as null, the construct query is cleared
+    construct_query: Optional[str]=None
+
+
+class MappingProfileOutSchema(BaseModel):
+    uuid: str = Field(alias='profile_id')
+    profile_name: str
+    col_mapping: dict[str,str]
+    namespaces: dict[str,str]
+    construct_query: str | None
+
+    class Config:
+        from_attributes = True
+        populate_by_name = True
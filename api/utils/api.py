@@ -1,13 +1,39 @@
+import hashlib
+import hmac
+
 from fastapi import HTTPException, status
 import requests
 import rdflib
 
+from api.dependencies.config import settings
+from api.utils.shared_cache import cache_key, get_shared_cache
+
+
+API_RULE_CACHE = 'api-rules'
+
 
 def get_ttl_rule(
         endpoint: str,
         username: str,
         password: str
 )->rdflib.Graph:
+    # Fetched rules are shared by the workers for a short time, so a burst of
+    # checks against the same API rule does not fetch it once per request
+    # The credentials are part of the key through an HMAC with a server
+    # secret, so the shared cache holds no plain hash of the password
+    credentials = hmac.new(
+        settings.FERNET_KEY.encode(),
+        cache_key(API_RULE_CACHE, username or '', password or '').encode(),
+        hashlib.sha256
+    ).hexdigest()
+    rule_key = cache_key(endpoint, credentials)
+    if settings.SHARED_CACHE_API_RULE_TTL > 0:
+        cached_rule = get_shared_cache().get(API_RULE_CACHE, rule_key)
+        if cached_rule is not None:
+            graph = rdflib.Graph()
+            graph.parse(data=cached_rule, format='nt')
+            return graph
+
     try:
         resp = requests.get(
             endpoint,
@@ -30,4 +56,12 @@ def get_ttl_rule(
             detail=f'Error parsing response into graph: {e}'
         )
 
+    if settings.SHARED_CACHE_API_RULE_TTL > 0:
+        get_shared_cache().set(
+            API_RULE_CACHE,
+            rule_key,
+            graph.serialize(format='nt', encoding='utf-8'),
+            ttl=settings.SHARED_CACHE_API_RULE_TTL
+        )
+
     return graph
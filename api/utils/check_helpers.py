@@ -1,12 +1,19 @@
+import asyncio
+import hashlib
+import hmac
 from io import BytesIO
+import json
+from tempfile import SpooledTemporaryFile
 import time
+from typing import AsyncIterator, BinaryIO, Dict, List, Optional, Tuple
+import zlib
 
-from fastapi import APIRouter, Depends, status, Security, HTTPException
-import pandas as pd
-import pyshacl
+from fastapi import APIRouter, Depends, status, Security, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
 import requests
 from sqlalchemy.ext.asyncio import AsyncSession
-from rdflib import Graph
+from rdflib import Dataset, Graph
 
 from api.schemas.app.check import (
     CheckInSchema,
@@ -15,9 +22,13 @@ from api.schemas.app.check import (
     DataSchema,
     DataSetType,
     DSpaceCheckSchema,
+    DSpaceBatchCheckSchema,
+    DSpaceCheckResultSchema,
+    CheckResult,
     CheckResultSchema
 )
 from api.models import Check
+from api.dependencies.config import settings
 from api.dependencies.security import company_user_level
 from api.dependencies.database import get_db
 from api.crud.check import (
@@ -30,21 +41,48 @@ from api.crud.check import (
 from api.crud.connector import db_get_connector, db_get_connector_by_internal_id
 from api.crud.companies import db_get_company
 from api.utils.api import get_ttl_rule
-from api.utils.convertors import dataframe_to_xml, xml_to_graph, graph_to_json_ld
+from api.utils.convertors import convert_dataframe, graph_to_json_ld
+from api.utils.lazy_import import lazy_import
+from api.utils.metrics import (
+    VALIDATIONS_IN_PROGRESS,
+    observe_stage,
+    record_validation
+)
+from api.utils.readers import read_data_set
+from api.utils.rules import select_shapes
+from api.utils.shared_cache import cache_key, get_shared_cache
+
+
+DSPACE_MANAGEMENT_URL = '51.138.27.252:8181'
+DSPACE_DATA_PLANE_URL = '51.138.27.252:8183'
+
+JSON_LD_MEDIA_TYPES = ('application/json', 'application/ld+json')
+RDF_MEDIA_TYPES = {
+    'text/turtle': 'turtle',
+    'application/n-triples': 'nt',
+    'application/n-quads': 'nquads',
+}
+
+pyshacl = lazy_import('pyshacl')
+
+DATA_SET_CACHE = 'data-sets'
+VALIDATION_CACHE = 'validation-results'
 
 
 async def get_ttl_rule_based_on_rule(db: AsyncSession, db_check: Check) -> Graph:
     if db_check.rule_source == RuleSource.digichecks_hosted:
-        ttl_rule = db_check.initialised_ttl_rule
+        with observe_stage('rule_load_hosted'):
+            ttl_rule = db_check.initialised_ttl_rule
     
     elif db_check.rule_source == RuleSource.api:
         db_connector = await db_get_connector_by_internal_id(db, db_check.connector_id)
         
-        ttl_rule = get_ttl_rule(
-            endpoint=db_check.rule,
-            username=db_connector.username,
-            password=db_connector.decrypt_password()
-        )
+        with observe_stage('rule_load_api'):
+            ttl_rule = get_ttl_rule(
+                endpoint=db_check.rule,
+                username=db_connector.username,
+                password=db_connector.decrypt_password()
+            )
     else:
         allowd_rules = ', '.join([rule.value for rule in RuleSource])
         raise HTTPException(
@@ -73,24 +111,434 @@ def start_dspace_transfer_process(consumer_url: str, dataset_id: str):
     return resp_transfer_process.json()
 
 
-def get_dspace_dataset(consumer_url: str, dataset_id: str, retry: int=5):
+def spool_dspace_dataset(
+        resp: requests.Response, checksum: str=None)->Tuple[SpooledTemporaryFile, str]:
+    # Reject datasets that announce themselves as too large before reading
+    content_length = resp.headers.get('Content-Length')
+    if content_length and int(content_length) > settings.DSPACE_MAX_DOWNLOAD_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f'Data set exceeds {settings.DSPACE_MAX_DOWNLOAD_SIZE} bytes'
+        )
+
+    # Stream the body to a temporary file that only spills to disk when it
+    # grows beyond the memory threshold
+    dataset_file = SpooledTemporaryFile(max_size=settings.DSPACE_SPOOL_MAX_MEMORY)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        for chunk in resp.iter_content(chunk_size=settings.DSPACE_DOWNLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > settings.DSPACE_MAX_DOWNLOAD_SIZE:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f'Data set exceeds {settings.DSPACE_MAX_DOWNLOAD_SIZE} bytes'
+                )
+            digest.update(chunk)
+            dataset_file.write(chunk)
+    except requests.exceptions.RequestException as e:
+        dataset_file.close()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f'Failed to download data set: {e}'
+        )
+    except BaseException:
+        dataset_file.close()
+        raise
+
+    if checksum and not hmac.compare_digest(digest.hexdigest(), checksum.lower()):
+        dataset_file.close()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='Data set checksum does not match the expected checksum'
+        )
+
+    dataset_file.seek(0)
+    return dataset_file, digest.hexdigest()
+
+
+def get_dspace_dataset(
+        consumer_url: str, dataset_id: str, checksum: str=None, retry: int=5
+)->Tuple[SpooledTemporaryFile, str]:
     def get_dspace_data(consumer_url: str, dataset_id: str):
         resp = requests.get(
-            f'http://{consumer_url}/api/data-plane/v1/consumer/{dataset_id}'
+            f'http://{consumer_url}/api/data-plane/v1/consumer/{dataset_id}',
+            stream=True
         )
-        resp.raise_for_status()
+        try:
+            resp.raise_for_status()
+        except requests.exceptions.HTTPError:
+            resp.close()
+            raise
         return resp
 
     error_msg = 'Too many retries'
     while retry > 0:
         try:
-            return get_dspace_data(consumer_url, dataset_id)
+            resp = get_dspace_data(consumer_url, dataset_id)
         except requests.exceptions.HTTPError as e:
             error_msg = str(e)
             retry -= 1
             time.sleep(5)
+            continue
+
+        with resp:
+            return spool_dspace_dataset(resp, checksum)
 
     raise HTTPException(
         status_code=status.HTTP_400_BAD_REQUEST,
         detail=f'Failed to start transfer process: {error_msg}'
-    )
\ No newline at end of file
+    )
+
+
+async def spool_request_body(request: Request)->Tuple[SpooledTemporaryFile, str]:
+    content_encoding = request.headers.get('Content-Encoding', 'identity').lower()
+    if content_encoding == 'gzip':
+        decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+    elif content_encoding == 'identity':
+        decompressor = None
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail='Content-Encoding must be either gzip or identity'
+        )
+
+    # The body is decompressed while it is received, the size limit applies
+    # to the decompressed data, so small gzip bombs are rejected too
+    body_file = SpooledTemporaryFile(max_size=settings.RDF_SPOOL_MAX_MEMORY)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async for chunk in request.stream():
+            if decompressor:
+                data, chunk = chunk, b''
+                while data and size + len(chunk) <= settings.RDF_MAX_BODY_SIZE:
+                    chunk += decompressor.decompress(
+                        data, settings.RDF_MAX_BODY_SIZE - size - len(chunk) + 1)
+                    # Concatenated gzip members, as gzip writes for appended
+                    # files, continue in a new decompressor
+                    data = b''
+                    if decompressor.eof and decompressor.unused_data:
+                        data = decompressor.unused_data
+                        decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+            size += len(chunk)
+            if size > settings.RDF_MAX_BODY_SIZE:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f'Data exceeds {settings.RDF_MAX_BODY_SIZE} bytes'
+                )
+            digest.update(chunk)
+            body_file.write(chunk)
+
+        if decompressor and not decompressor.eof:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail='Data is not a complete gzip stream'
+            )
+    except zlib.error as e:
+        body_file.close()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f'Data could not be decompressed: {e}'
+        )
+    except BaseException:
+        body_file.close()
+        raise
+
+    body_file.seek(0)
+    return body_file, digest.hexdigest()
+
+
+def parse_data_graph(body_file: BinaryIO, rdf_format: str)->Graph:
+    # The N-Triples and N-Quads parsers read the file line by line
+    if rdf_format == 'nquads':
+        dataset = Dataset()
+        dataset.parse(body_file, format=rdf_format)
+        graph = Graph()
+        for s, p, o, _ in dataset.quads():
+            graph.add((s, p, o))
+        return graph
+
+    graph = Graph()
+    graph.parse(body_file, format=rdf_format)
+    return graph
+
+
+def get_request_media_type(request: Request)->str:
+    content_type = request.headers.get('Content-Type', JSON_LD_MEDIA_TYPES[0])
+    media_type = content_type.split(';')[0].strip().lower()
+
+    if media_type not in JSON_LD_MEDIA_TYPES and media_type not in RDF_MEDIA_TYPES:
+        allowed_media_types = ', '.join([*JSON_LD_MEDIA_TYPES, *RDF_MEDIA_TYPES])
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f'Content-Type not supported, choose: {allowed_media_types}'
+        )
+    return media_type
+
+
+async def parse_request_data(body_file: BinaryIO, media_type: str)->Graph | str:
+    with observe_stage('data_parse'):
+        return await _parse_request_data(body_file, media_type)
+
+
+async def _parse_request_data(body_file: BinaryIO, media_type: str)->Graph | str:
+    if media_type in JSON_LD_MEDIA_TYPES:
+        try:
+            payload = json.load(body_file)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f'Data is not valid JSON: {e}'
+            )
+        if not isinstance(payload, dict):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail='Data must be a JSON-LD object'
+            )
+        try:
+            data = DataSchema(**payload)
+        except ValidationError as e:
+            raise RequestValidationError(e.errors())
+        return data.as_ttl
+
+    try:
+        return await asyncio.to_thread(
+            parse_data_graph, body_file, RDF_MEDIA_TYPES[media_type])
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f'Data could not be parsed as {media_type}: {e}'
+        )
+
+
+def get_cached_validation(rule_key: str, data_key: str)->Optional[Tuple[bool, str]]:
+    # Only rules with a content hash are cached, API rules can change anytime
+    if not rule_key or not data_key:
+        return None
+    value = get_shared_cache().get(VALIDATION_CACHE, cache_key(rule_key, data_key))
+    if value is None:
+        return None
+    result = json.loads(value)
+    return result['conforms'], result['results_text']
+
+
+def set_cached_validation(rule_key: str, data_key: str, conforms: bool, results_text: str):
+    if not rule_key or not data_key:
+        return
+    get_shared_cache().set(
+        VALIDATION_CACHE,
+        cache_key(rule_key, data_key),
+        json.dumps({'conforms': conforms, 'results_text': results_text}).encode()
+    )
+
+
+def validate_data_graph(
+        data_graph: Graph | str, ttl_rule: Graph, rule_key: str=None)->Tuple[bool, str]:
+    # Hosted rules are indexed by the targets of their shapes, only the
+    # shapes that can select a focus node in the data graph are validated
+    shacl_graph = ttl_rule
+    if rule_key and settings.SHAPE_TARGET_INDEX:
+        if isinstance(data_graph, str):
+            with observe_stage('data_parse'):
+                data_graph = Graph().parse(data=data_graph, format='turtle')
+        with observe_stage('shape_selection'):
+            shacl_graph = select_shapes(rule_key, ttl_rule, data_graph)
+
+    with VALIDATIONS_IN_PROGRESS.track_inprogress(), observe_stage('validation'):
+        conforms, results_graph, results_text = pyshacl.validate(
+            data_graph=data_graph,
+            shacl_graph=shacl_graph,
+            ont_graph=ttl_rule,
+            inference='none', # none or rdfs
+            abort_on_first=False,
+            allow_infos=False,
+            allow_warnings=True,
+            meta_shacl=False,
+            advanced=True,
+            js=False,
+            debug=False,
+            serialize_report_graph='turtle'
+        )
+    record_validation(conforms)
+    return conforms, results_text
+
+
+async def run_checks_on_graph(
+        db: AsyncSession, check_uuids: List[str], data_graph: Graph
+)->List[CheckResultSchema]:
+    # Rules are loaded up front, so an unknown check fails before validating
+    db_checks = [
+        await db_get_check(db, check_uuid) for check_uuid in dict.fromkeys(check_uuids)
+    ]
+    ttl_rules = [await get_ttl_rule_based_on_rule(db, db_check) for db_check in db_checks]
+
+    def validate_all()->List[Tuple[bool, str]]:
+        return [
+            validate_data_graph(data_graph, ttl_rule, db_check.rule_hash)
+            for db_check, ttl_rule in zip(db_checks, ttl_rules)
+        ]
+
+    results = await asyncio.to_thread(validate_all)
+
+    return [
+        CheckResultSchema(
+            check_id=db_check.uuid,
+            check_name=db_check.check_name,
+            check_result=CheckResult.PASS if conforms else CheckResult.FAIL,
+            description=results_text
+        )
+        for db_check, (conforms, results_text) in zip(db_checks, results)
+    ]
+
+
+def get_dspace_data_graph(
+        dataset_file: BinaryIO,
+        data_set_type: DataSetType,
+        col_mapping: Dict[str,str]=None,
+        namespaces: Dict[str,str]=None
+)->str:
+    if data_set_type in (DataSetType.EXCEL, DataSetType.CSV, DataSetType.PARQUET):
+        df = read_data_set(dataset_file, data_set_type, (col_mapping or {}).keys())
+
+        turtle = convert_dataframe(
+            df=df,
+            col_mapping=col_mapping,
+            namespaces=namespaces
+        )
+
+        json_ld = graph_to_json_ld(turtle)
+
+    elif data_set_type == DataSetType.JSON_LD:
+        with observe_stage('data_parse'):
+            json_ld = json.load(dataset_file)
+
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='Data set type must be either excel, csv, parquet or JSON-LD'
+        )
+
+    if not isinstance(json_ld, dict):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='Data set must be a JSON-LD object'
+        )
+
+    with observe_stage('data_parse'):
+        data_schema = DataSchema(**json_ld)
+        return data_schema.as_ttl
+
+
+def run_dspace_dataset_check(
+        dataset_id: str,
+        data_set_type: DataSetType,
+        ttl_rule: Graph,
+        col_mapping: Dict[str,str]=None,
+        namespaces: Dict[str,str]=None,
+        checksum: str=None,
+        rule_key: str=None
+)->Tuple[bool, str]:
+    def get_data_key(dataset_digest: str)->str:
+        # Bound to the data set, a checksum only matches a cached entry when
+        # that data set was downloaded and had this digest before
+        return cache_key(
+            dataset_id,
+            dataset_digest.lower(),
+            data_set_type.value,
+            json.dumps(col_mapping or {}, sort_keys=True),
+            json.dumps(namespaces or {}, sort_keys=True),
+            settings.CONVERSION_ENGINE.value
+        )
+
+    # A data set with a known checksum that was converted before, by any
+    # worker, does not need to be transferred again. Entries are only
+    # written for downloads whose digest was computed here.
+    data_graph = None
+    if checksum:
+        data_key = get_data_key(checksum)
+        cached_result = get_cached_validation(rule_key, data_key)
+        if cached_result is not None:
+            return cached_result
+        data_graph = get_shared_cache().get(DATA_SET_CACHE, data_key)
+
+    if data_graph is None:
+        with observe_stage('dspace_transfer_wait'):
+            start_dspace_transfer_process(
+                consumer_url=DSPACE_MANAGEMENT_URL,
+                dataset_id=dataset_id
+            )
+        with observe_stage('dspace_download'):
+            dataset_file, dataset_digest = get_dspace_dataset(
+                consumer_url=DSPACE_DATA_PLANE_URL,
+                dataset_id=dataset_id,
+                checksum=checksum
+            )
+        with dataset_file:
+            data_key = get_data_key(dataset_digest)
+            cached_result = get_cached_validation(rule_key, data_key)
+            if cached_result is not None:
+                return cached_result
+
+            data_graph = get_dspace_data_graph(
+                dataset_file, data_set_type, col_mapping, namespaces)
+        get_shared_cache().set(DATA_SET_CACHE, data_key, data_graph.encode())
+    else:
+        data_graph = data_graph.decode()
+
+    conforms, results_text = validate_data_graph(data_graph, ttl_rule, rule_key)
+    set_cached_validation(rule_key, data_key, conforms, results_text)
+    return conforms, results_text
+
+
+async def run_dspace_batch_check(
+        db_check: Check, ttl_rule: Graph, data: DSpaceBatchCheckSchema
+)->AsyncIterator[DSpaceCheckResultSchema]:
+    concurrency = min(
+        data.concurrency or settings.DSPACE_MAX_CONCURRENCY,
+        settings.DSPACE_MAX_CONCURRENCY
+    )
+    semaphore = asyncio.Semaphore(concurrency)
+    checksums = data.checksums or {}
+
+    async def check_dataset(dataset_id: str)->DSpaceCheckResultSchema:
+        result = DSpaceCheckResultSchema(
+            dataset_id=dataset_id,
+            check_id=db_check.uuid,
+            check_name=db_check.check_name
+        )
+        async with semaphore:
+            try:
+                conforms, results_text = await asyncio.to_thread(
+                    run_dspace_dataset_check,
+                    dataset_id=dataset_id,
+                    data_set_type=data.data_set_type,
+                    ttl_rule=ttl_rule,
+                    col_mapping=data.col_mapping,
+                    namespaces=data.namespaces,
+                    checksum=checksums.get(dataset_id),
+                    rule_key=db_check.rule_hash
+                )
+            except HTTPException as e:
+                result.error = str(e.detail)
+                return result
+            except Exception as e:
+                result.error = f'Failed to check data set: {e}'
+                return result
+
+        result.check_result = CheckResult.PASS if conforms else CheckResult.FAIL
+        result.description = results_text
+        return result
+
+    # Yield the results in order of completion, so a slow data set does not
+    # hold back the results of the others
+    tasks = [
+        asyncio.create_task(check_dataset(dataset_id))
+        for dataset_id in dict.fromkeys(data.dataset_ids)
+    ]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
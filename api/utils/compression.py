@@ -0,0 +1,161 @@
+import zlib
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class GzipCompressor:
+
+    def __init__(self) -> None:
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes)->bytes:
+        # Flushed per chunk, so streamed responses arrive as they are sent
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self)->bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliCompressor:
+
+    def __init__(self) -> None:
+        self._compressor = brotli.Compressor(quality=4)
+
+    def compress(self, data: bytes)->bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self)->bytes:
+        return self._compressor.finish()
+
+
+class ZstdCompressor:
+
+    def __init__(self) -> None:
+        self._compressor = zstandard.ZstdCompressor(level=3).compressobj()
+
+    def compress(self, data: bytes)->bytes:
+        return (
+            self._compressor.compress(data)
+            + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        )
+
+    def finish(self)->bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+# In order of preference, when the client accepts several equally
+COMPRESSORS = {
+    encoding: compressor for encoding, compressor, available in (
+        ('zstd', ZstdCompressor, zstandard is not None),
+        ('br', BrotliCompressor, brotli is not None),
+        ('gzip', GzipCompressor, True),
+    ) if available
+}
+
+
+def negotiate_encoding(accept_encoding: str)->Optional[str]:
+    qualities: Dict[str, float] = {}
+    for part in accept_encoding.split(','):
+        encoding, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                continue
+        qualities[encoding.strip().lower()] = quality
+
+    wildcard = qualities.get('*', 0)
+    accepted = [
+        (qualities.get(encoding, wildcard), -preference, encoding)
+        for preference, encoding in enumerate(COMPRESSORS)
+    ]
+    quality, _, encoding = max(accepted)
+    return encoding if quality > 0 else None
+
+
+# Compresses responses of at least minimum_size bytes with the best encoding
+# the client accepts: zstd and brotli when installed, otherwise gzip. Small
+# responses are sent as they are, compressing them costs more than it saves.
+class CompressionMiddleware:
+
+    def __init__(self, app: ASGIApp, minimum_size: int=1024) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get('Accept-Encoding', ''))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Optional[Message] = None
+        compressor = None
+        skip = False
+
+        async def send_wrapper(message: Message):
+            nonlocal start_message, compressor, skip
+            if message['type'] == 'http.response.start':
+                headers = Headers(raw=message['headers'])
+                if 'content-encoding' in headers:
+                    skip = True
+                    await send(message)
+                else:
+                    # Held back until the size of the body is known
+                    start_message = message
+                return
+
+            if skip or message['type'] != 'http.response.body':
+                await send(message)
+                return
+
+            body = message.get('body', b'')
+            more_body = message.get('more_body', False)
+
+            if compressor is None:
+                if not more_body and len(body) < self.minimum_size:
+                    skip = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                compressor = COMPRESSORS[encoding]()
+                started = False
+            else:
+                started = True
+
+            data = compressor.compress(body) if body else b''
+            if not more_body:
+                data += compressor.finish()
+
+            if not started:
+                headers = MutableHeaders(scope=start_message)
+                headers['Content-Encoding'] = encoding
+                headers.add_vary_header('Accept-Encoding')
+                if more_body:
+                    if 'content-length' in headers:
+                        del headers['Content-Length']
+                else:
+                    headers['Content-Length'] = str(len(data))
+                await send(start_message)
+
+            if data or not more_body:
+                await send({'type': 'http.response.body', 'body': data, 'more_body': more_body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -1,49 +1,142 @@
+from __future__ import annotations
+
+from decimal import Decimal
+import itertools
+import json
 import os
-import subprocess
-from typing import Dict
-from xml.etree import ElementTree as ET
+import re
+import tempfile
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Tuple
 
-import pandas as pd
+import orjson
 from rdflib import Graph, Namespace, URIRef, Literal
 from rdflib.namespace import RDF
-import json
+
+from fastapi.encoders import jsonable_encoder
+
+from api.dependencies.config import ConversionEngine, settings
+from api.utils.lazy_import import lazy_import
+from api.utils.metrics import observe_stage
+from api.utils.sparql_anything import run_sparql_anything
+
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+SUPPLY_POINT_QUERY_PATH = os.path.join(
+    os.path.dirname(__file__), 'supplyPointQuery.sparql')
+
+XML_CHUNK_SIZE = 10000
+JSON_LD_CHUNK_SIZE = 64 * 1024
+XSD_DOUBLE_PATTERN = r'(\+|-)?([0-9]+(\.[0-9]*)?|\.[0-9]+)([Ee](\+|-)?[0-9]+)?|(\+|-)?INF|NaN'
+INVALID_IRI_PATTERN = r'[\x00-\x20<>"{}|^`\\]'
+
+EX = Namespace('http://example.org/realia/dataset/')
+REALIA = Namespace('http://realia.es/realia-otl/')
+SML = Namespace('https://w3id.org/sml/def#')
+QUDT = Namespace('http://qudt.org/schema/qudt/')
+
+
+# Streams the rows of a data frame as XML. The output is the same as
+# ElementTree.write(..., encoding='utf-8', xml_declaration=True) on a
+# <root><row>...</row></root> tree with one element per mapped column.
+# Besides a data frame, it takes an iterable of data frame chunks that
+# is consumed while writing.
+class DataFrameXML:
+
+    def __init__(
+            self,
+            df: pd.DataFrame | Iterable[pd.DataFrame],
+            col_mapping: Dict[str,str],
+            chunk_size: int=XML_CHUNK_SIZE
+    ) -> None:
+        self.df = df
+        self.col_mapping = col_mapping
+        self.chunk_size = chunk_size
+
+    def _chunks(self)->Iterator[pd.DataFrame]:
+        if isinstance(self.df, pd.DataFrame):
+            for start in range(0, len(self.df), self.chunk_size):
+                yield self.df.iloc[start:start + self.chunk_size]
+        else:
+            yield from (chunk for chunk in self.df if len(chunk))
+
+    def _rows(self, df: pd.DataFrame)->str:
+        if not self.col_mapping:
+            return '<row />' * len(df)
+
+        rows = pd.Series('<row>', index=range(len(df)), dtype=object)
+        texts = dataframe_columns_as_text(df, self.col_mapping.keys())
+        for text, tag in zip(texts, self.col_mapping.values()):
+            escaped = (
+                text
+                .str.replace('&', '&amp;', regex=False)
+                .str.replace('<', '&lt;', regex=False)
+                .str.replace('>', '&gt;', regex=False)
+            )
+            element = f'<{tag}>' + escaped + f'</{tag}>'
+            rows += element.where(text != '', f'<{tag} />')
+        rows += '</row>'
+        return ''.join(rows)
+
+    def iter_bytes(self)->Iterator[bytes]:
+        yield b"<?xml version='1.0' encoding='utf-8'?>\n"
+        chunks = self._chunks()
+        first_chunk = next(chunks, None)
+        if first_chunk is None:
+            yield b'<root />'
+            return
+
+        yield b'<root>'
+        for chunk in itertools.chain([first_chunk], chunks):
+            yield self._rows(chunk).encode('utf-8', 'xmlcharrefreplace')
+        yield b'</root>'
+
+    def write(self, target: str | BinaryIO):
+        if isinstance(target, str):
+            with open(target, 'wb') as xml_file:
+                self.write(xml_file)
+            return
+
+        for data in self.iter_bytes():
+            target.write(data)
 
 
-def dataframe_to_xml(df: pd.DataFrame, col_mapping: Dict[str,str])->ET.ElementTree:
-    root = ET.Element('root')
-    for _, row in df.iterrows():
-        element = ET.SubElement(root, 'row')
-        for df_col, xml_col in col_mapping.items():
-            ET.SubElement(element, xml_col).text = str(row.get(df_col, 'N/A'))
+def dataframe_to_xml(
+        df: pd.DataFrame | Iterable[pd.DataFrame], col_mapping: Dict[str,str])->DataFrameXML:
+    return DataFrameXML(df, col_mapping)
 
-    return ET.ElementTree(root)
 
+def conversion_temp_dir()->str | None:
+    # Prefer tmpfs, so conversion inputs never touch the disk
+    if settings.CONVERSION_TEMP_DIR:
+        return settings.CONVERSION_TEMP_DIR
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return None
 
-def xml_to_graph(xml: ET.ElementTree, namespaces: Dict[str,str])->Graph:
-    temp_dir = 'temp'
-    current_dir = os.path.dirname(__file__)
 
-    jar_path = os.path.join(current_dir, 'sparql-anything-0.9.0.jar')
-    query_path = os.path.join(current_dir, 'supplyPointQuery.sparql')
-    
-    # Create temp directory for the xml data
-    os.makedirs(os.path.join(current_dir, temp_dir), exist_ok=True)
-    xml_path = os.path.join(current_dir, temp_dir, 'supplyPoint.xml')
-    xml.write(xml_path, encoding='utf-8', xml_declaration=True)
+def xml_to_graph(
+        xml: DataFrameXML,
+        namespaces: Dict[str,str],
+        query_path: str=SUPPLY_POINT_QUERY_PATH
+)->Graph:
+    # Every conversion gets its own input file, so conversions can run in
+    # parallel threads and processes
+    with tempfile.NamedTemporaryFile(
+        prefix='supplyPoint-', suffix='.xml', dir=conversion_temp_dir()
+    ) as xml_file:
+        with observe_stage('xml_build'):
+            xml.write(xml_file)
+            xml_file.flush()
 
-    # Run the conversion
-    command = f'java -jar {jar_path} -q {query_path} -v uri=""{xml_path}""'
-    result = subprocess.run(command, shell=True, capture_output=True)
-    if result.returncode != 0:
-        raise ValueError(f'Error running the conversion: {result.stderr}')
-    
-    # Clean up
-    os.remove(xml_path)
-    os.rmdir(os.path.join(current_dir, temp_dir))
+        # Run the conversion
+        with observe_stage('jvm_conversion'):
+            turtle = run_sparql_anything(query_path, xml_file.name)
 
     # Parse the result to a graph
     graph = Graph()
-    graph.parse(data=result.stdout, format='turtle')
+    graph.parse(data=turtle, format='turtle')
 
     # Bind and define the namespaces
     for name, uri in namespaces.items():
@@ -52,51 +145,288 @@ def xml_to_graph(xml: ET.ElementTree, namespaces: Dict[str,str])->Graph:
     return graph
 
 
-def graph_to_json_ld(graph: Graph)->str:
-    jsonld_data = {
-        '@context': [
-            'https://stdigichecksprod.blob.core.windows.net/public/REALIA_context.jsonld',
-            'https://stdigichecksprod.blob.core.windows.net/public/digiChecks_topLevelPermitOntology_context.jsonld'
-        ],
-        '@graph': []
+def dataframe_columns_as_text(
+        df: pd.DataFrame, columns: Iterable[str])->List[pd.Series]:
+    # The same text as str(row.get(column, 'N/A')) on df.iterrows(), which
+    # upcasts every row to the common dtype of all columns first
+    values = df.to_numpy()
+    texts = []
+    for column in columns:
+        if column not in df.columns:
+            texts.append(pd.Series('N/A', index=range(len(df)), dtype=object))
+            continue
+
+        position = df.columns.get_loc(column)
+        if not isinstance(position, int):
+            position = np.flatnonzero(df.columns == column)[0]
+        column_values = values[:, position]
+
+        if column_values.dtype.kind in 'biufcO':
+            text = column_values.astype(str)
+        else:
+            # Datetimes are boxed to Timestamps by iterrows
+            text = pd.Series(column_values).astype(object).map(str)
+        texts.append(pd.Series(text, dtype=object))
+
+    return texts
+
+
+def _xsd_double(text: pd.Series)->Tuple[pd.Series, pd.Series]:
+    # xsd:double() on the text, casts that fail leave the value unbound
+    valid = text.str.fullmatch(XSD_DOUBLE_PATTERN).eq(True)
+    return pd.to_numeric(text.where(valid), errors='coerce').astype(float), valid
+
+
+def _double_literals(values: pd.Series, valid: pd.Series)->pd.Series:
+    return values.map(Literal).where(valid)
+
+
+def _iri(namespace: Namespace, text: pd.Series, suffix: str='')->pd.Series:
+    # URI(CONCAT(...)), IRIs that are not valid leave the node unbound
+    iri = str(namespace) + text + suffix
+    valid = iri.str.contains(INVALID_IRI_PATTERN).eq(False)
+    return iri.where(valid).map(URIRef, na_action='ignore')
+
+
+def _add_triples(graph: Graph, subjects, predicate: URIRef, objects):
+    # Like a CONSTRUCT template, triples with an unbound term are left out
+    triples = pd.DataFrame({'s': subjects, 'o': objects}).dropna().drop_duplicates()
+    for s, o in triples.itertuples(index=False):
+        graph.add((s, predicate, o))
+
+
+def _query_prefixes(query_path: str)->Dict[str,str]:
+    with open(query_path, encoding='utf-8') as query_file:
+        return dict(re.findall(r'PREFIX\s+(\w*):\s*<([^>]*)>', query_file.read()))
+
+
+def _add_supply_point_rows(
+        graph: Graph, texts: List[pd.Series], totals: Dict[str,dict])->bool:
+    missing = pd.Series(np.nan, index=range(len(texts[0]) if texts else 0), dtype=object)
+
+    def member(position: int)->pd.Series:
+        # Empty elements have no text member
+        if position > len(texts):
+            return missing
+        text = texts[position - 1]
+        return text.where(text != '')
+
+    cgp = member(1)
+    cgp_type = member(2)
+    lga = member(3)
+    supply_point = member(7)
+    supply_point_type = member(8)
+    power = member(9)
+    simultaneous_power = member(10)
+    power_double, power_valid = _xsd_double(power)
+
+    # Aggregates over every row with a supply point type and power
+    aggregated = supply_point_type.notna() & power.notna() & (len(texts) >= 7)
+    for supply_point_type_name, total in totals.items():
+        rows = aggregated & (supply_point_type == supply_point_type_name)
+        total['rows'] += int(rows.sum())
+        total['valid'] = total['valid'] and bool(power_valid[rows].all())
+        total['sum'] = sum(power_double[rows].tolist(), total['sum'])
+
+    # Rows matching the triple patterns of the construct query
+    matched = (
+        cgp.notna() & cgp_type.notna() & lga.notna() & supply_point.notna()
+        & supply_point_type.notna() & power.notna() & simultaneous_power.notna()
+    )
+    cgp = cgp[matched]
+    cgp_type = cgp_type[matched]
+    lga = lga[matched]
+    supply_point = supply_point[matched]
+    supply_point_type = supply_point_type[matched]
+    power_double = _double_literals(power_double[matched], power_valid[matched])
+    simultaneous_power_double = _double_literals(
+        *_xsd_double(simultaneous_power[matched]))
+
+    cgp_node = _iri(EX, cgp)
+    lga_node = _iri(EX, lga)
+    supply_point_node = _iri(EX, supply_point)
+    power_node = _iri(EX, supply_point, '-Power')
+    simultaneous_power_node = _iri(REALIA, cgp, '-SimPower')
+    kilowatt = pd.Series(QUDT.KiloW, index=cgp.index)
+
+    _add_triples(graph, cgp_node, RDF.type, _iri(REALIA, cgp_type))
+    _add_triples(graph, cgp_node, SML.isConnectedTo, lga_node)
+    _add_triples(graph, lga_node, RDF.type, pd.Series(REALIA.LGA, index=cgp.index))
+    _add_triples(graph, lga_node, SML.isConnectedTo, supply_point_node)
+    _add_triples(graph, supply_point_node, RDF.type, _iri(EX, supply_point_type))
+    _add_triples(graph, supply_point_node, REALIA.designPower, power_node)
+    _add_triples(graph, power_node, SML.hasUnit, kilowatt)
+    _add_triples(graph, power_node, RDF.value, power_double)
+    _add_triples(graph, cgp_node, REALIA.simultaneousPower, simultaneous_power_node)
+    _add_triples(graph, simultaneous_power_node, SML.hasUnit, kilowatt)
+    _add_triples(graph, simultaneous_power_node, RDF.value, simultaneous_power_double)
+
+    return bool(matched.any())
+
+
+def _total_power(total: dict)->Literal:
+    if not total['rows']:
+        return Literal(0)
+    if not total['valid']:
+        # A failed cast makes the SUM unbound
+        return None
+    return Literal(float(total['sum']))
+
+
+def dataframe_to_graph(
+        df: pd.DataFrame | Iterable[pd.DataFrame],
+        col_mapping: Dict[str,str],
+        namespaces: Dict[str,str]
+)->Graph:
+    # Applies the supplyPointQuery.sparql mapping directly to the data frame,
+    # or chunk by chunk to an iterable of data frames. Like the rdf:_n
+    # members of the XML rows, cells are addressed by the position of their
+    # column in the column mapping.
+    graph = Graph()
+    for name, uri in _query_prefixes(SUPPLY_POINT_QUERY_PATH).items():
+        graph.bind(name, Namespace(uri))
+
+    totals = {
+        supply_point_type_name: {'rows': 0, 'valid': True, 'sum': 0}
+        for supply_point_type_name in ('Apartment', 'ChargingPoint')
     }
-    sml = Namespace('https://w3id.org/sml/def#')
+    matched = False
+    for chunk in [df] if isinstance(df, pd.DataFrame) else df:
+        texts = dataframe_columns_as_text(chunk, col_mapping.keys())
+        matched = _add_supply_point_rows(graph, texts, totals) or matched
+
+    if matched:
+        apartment_count = totals['Apartment']['rows']
+        project = EX.realiaMadridProject
+        project_totals = [
+            (REALIA.totalApartmentPower, EX.totalApartmentPowerMadrid,
+             _total_power(totals['Apartment'])),
+            (REALIA.totalChargingPointPower, EX.totalChargingPointPowerMadrid,
+             _total_power(totals['ChargingPoint'])),
+            (REALIA.neededChargingPointPower, EX.neededChargingPointPowerMadrid,
+             Literal(float(apartment_count * Decimal('3.68') * Decimal('0.1')))),
+        ]
+        graph.add((project, RDF.type, REALIA.RealiaProject))
+        for predicate, node, value in project_totals:
+            graph.add((project, predicate, node))
+            graph.add((node, SML.hasUnit, QUDT.KiloW))
+            if value is not None:
+                graph.add((node, RDF.value, value))
+
+    # Bind and define the namespaces
+    for name, uri in (namespaces or {}).items():
+        graph.bind(name, Namespace(uri))
+
+    return graph
+
+
+def convert_dataframe(
+        df: pd.DataFrame | Iterable[pd.DataFrame],
+        col_mapping: Dict[str,str],
+        namespaces: Dict[str,str],
+        query_path: str=SUPPLY_POINT_QUERY_PATH
+)->Graph:
+    # The native engine only implements the built-in supply point mapping
+    if (settings.CONVERSION_ENGINE == ConversionEngine.native
+            and query_path == SUPPLY_POINT_QUERY_PATH):
+        with observe_stage('native_conversion'):
+            return dataframe_to_graph(df, col_mapping, namespaces)
+
+    xml = dataframe_to_xml(df=df, col_mapping=col_mapping)
+    return xml_to_graph(xml=xml, namespaces=namespaces, query_path=query_path)
 
-    for s in graph.subjects():
+
+JSON_LD_CONTEXT = [
+    'https://stdigichecksprod.blob.core.windows.net/public/REALIA_context.jsonld',
+    'https://stdigichecksprod.blob.core.windows.net/public/digiChecks_topLevelPermitOntology_context.jsonld'
+]
+
+
+def iter_json_ld_nodes(graph: Graph)->Iterator[dict]:
+    value_nodes = {}
+    qnames = {}
+
+    def value_node(o)->Tuple[Literal, URIRef]:
+        # Memoized rdf:value and sml:hasUnit of the (shared) value nodes
+        if o not in value_nodes:
+            value = None if isinstance(o, Literal) else graph.value(o, RDF.value)
+            unit = graph.value(o, SML.hasUnit) if value is not None else None
+            value_nodes[o] = (value, unit)
+        return value_nodes[o]
+
+    def qname(uri: URIRef)->str:
+        # Use graph.qname() to get prefixed names
+        if uri not in qnames:
+            qnames[uri] = graph.qname(uri)
+        return qnames[uri]
+
+    # Emit every typed subject once
+    for s in graph.subjects(unique=True):
         rdf_type = graph.value(s, RDF.type)
-        if rdf_type:
-            # Use graph.qname() to get prefixed names
-            node = {
-                '@id': graph.qname(s),
-                '@type': graph.qname(rdf_type),
-                'quantitativeProperties': {},
-                'nonQuantitativeProperties': {},
-                'relations': {}
-            }
-            
-            for p, o in graph.predicate_objects(s):
-                # Skip RDF.type as it's already handled
-                if p == RDF.type:
-                    continue
-                    
-                value_triples = list(graph.triples((o, RDF.value, None)))
-                if value_triples:
-                    value = value_triples[0][2].value
-                    unit = graph.value(o, sml.hasUnit)
-                    unit_str = graph.qname(unit) if unit else None
-                    
-                    # Use qname for predicate
-                    node['quantitativeProperties'][graph.qname(p)] = {
-                        'value': value,
-                        'hasUnit': unit_str
-                    }
-                else:
-                    # Handle relations, using qname for both predicate and object
-                    if isinstance(o, URIRef):  # Only convert URIs to qname
-                        node['relations'][graph.qname(p)] = graph.qname(o)
-                    else:
-                        node['relations'][graph.qname(p)] = str(o)
-                        
-            jsonld_data['@graph'].append(node)
-        
-    return jsonld_data
+        if not rdf_type:
+            continue
+
+        node = {
+            '@id': qname(s),
+            '@type': qname(rdf_type),
+            'quantitativeProperties': {},
+            'nonQuantitativeProperties': {},
+            'relations': {}
+        }
+
+        for p, o in graph.predicate_objects(s):
+            # Skip RDF.type as it's already handled
+            if p == RDF.type:
+                continue
+
+            value, unit = value_node(o)
+            if value is not None:
+                node['quantitativeProperties'][qname(p)] = {
+                    'value': value.value,
+                    'hasUnit': qname(unit) if unit else None
+                }
+            elif isinstance(o, URIRef):  # Only convert URIs to qname
+                node['relations'][qname(p)] = qname(o)
+            else:
+                node['relations'][qname(p)] = str(o)
+
+        yield node
+
+
+def graph_to_json_ld(graph: Graph)->dict:
+    return {
+        '@context': JSON_LD_CONTEXT,
+        '@graph': list(iter_json_ld_nodes(graph))
+    }
+
+
+def _json_default(obj):
+    return jsonable_encoder(obj)
+
+
+def _dumps_json_ld_node(node: dict)->bytes:
+    try:
+        return orjson.dumps(node, default=_json_default)
+    except orjson.JSONEncodeError:
+        # orjson only encodes 64-bit integers, xsd:integer values can be larger
+        return json.dumps(
+            node, default=_json_default, ensure_ascii=False, allow_nan=False,
+            separators=(',', ':')
+        ).encode()
+
+
+def stream_json_ld(graph: Graph)->Iterator[bytes]:
+    # Same data as graph_to_json_ld, encoded one node at a time with orjson
+    # and sent in chunks, so every chunk is worth a write and compressing.
+    # orjson writes NaN and infinite doubles as null and exponents without a
+    # plus sign.
+    chunk = bytearray(b'{"@context":' + orjson.dumps(JSON_LD_CONTEXT) + b',"@graph":[')
+    for index, node in enumerate(iter_json_ld_nodes(graph)):
+        if index:
+            chunk += b','
+        chunk += _dumps_json_ld_node(node)
+        if len(chunk) >= JSON_LD_CHUNK_SIZE:
+            yield bytes(chunk)
+            chunk.clear()
+    chunk += b']}'
+    yield bytes(chunk)
@@ -1,9 +1,52 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import hmac
+import secrets
+
 from passlib.context import CryptContext
 
+from api.dependencies.config import settings
+from api.utils.ttl_cache import TTLCache
+
 crypt_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt holds the CPU for a long time, so it runs in a small pool instead of
+# on the event loop, which bounds the CPU that token requests can take
+hash_executor = ThreadPoolExecutor(
+    max_workers=settings.HASH_WORKERS, thread_name_prefix='hash')
+
+# Recently verified secrets, stored as a keyed digest and never in plain text
+verified_secret_cache: TTLCache[bool] = TTLCache(
+    maxsize=settings.VERIFIED_SECRET_CACHE_MAX_SIZE,
+    ttl=settings.VERIFIED_SECRET_CACHE_TTL
+)
+_digest_key = secrets.token_bytes(32)
+
 def hash_password(password: str) -> str:
     return crypt_context.hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return crypt_context.verify(plain_password, hashed_password)
+
+async def hash_password_async(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(hash_executor, hash_password, password)
+
+async def verify_client_secret(
+        client_id: str, client_secret: str, hashed_client_secret: str) -> bool:
+    # The stored hash is part of the key, so a new secret is verified again
+    digest = hmac.new(
+        _digest_key,
+        f'{client_id}:{hashed_client_secret}:{client_secret}'.encode(),
+        hashlib.sha256
+    ).digest()
+    if verified_secret_cache.get(digest):
+        return True
+
+    loop = asyncio.get_running_loop()
+    verified = await loop.run_in_executor(
+        hash_executor, verify_password, client_secret, hashed_client_secret)
+    if verified:
+        verified_secret_cache.set(digest, True)
+    return verified
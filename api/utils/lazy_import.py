@@ -0,0 +1,48 @@
+import importlib
+import types
+
+
+# The conversion and validation libraries are only needed by the check and
+# convertor routes. They are imported on first use, so workers that serve
+# CRUD requests start fast and small. A preloading gunicorn master imports
+# them up front instead, see gunicorn.conf.py.
+HEAVY_MODULES = (
+    'numpy',
+    'pandas',
+    'openpyxl',
+    'pyarrow',
+    'pyarrow.csv',
+    'pyarrow.parquet',
+    'pyshacl',
+    'rdflib.plugins.sparql',
+    'rdflib.plugins.parsers.notation3',
+    'rdflib.plugins.parsers.ntriples',
+    'rdflib.plugins.parsers.jsonld',
+    'rdflib.plugins.serializers.turtle',
+    'rdflib.plugins.serializers.nt',
+)
+
+
+class LazyModule(types.ModuleType):
+
+    def __init__(self, name: str) -> None:
+        super().__init__(name)
+        self._module = None
+
+    def __getattr__(self, attr: str):
+        # Only called for attributes the proxy does not have itself
+        if self._module is None:
+            self._module = importlib.import_module(self.__name__)
+        return getattr(self._module, attr)
+
+    def __dir__(self):
+        return dir(importlib.import_module(self.__name__))
+
+
+def lazy_import(name: str)->types.ModuleType:
+    return LazyModule(name)
+
+
+def import_heavy_modules():
+    for name in HEAVY_MODULES:
+        importlib.import_module(name)
@@ -0,0 +1,223 @@
+from dataclasses import dataclass
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from typing import Dict, List, Tuple
+
+from fastapi import HTTPException, status
+from rdflib import Literal, Namespace, URIRef, Variable
+from rdflib.paths import Path
+
+from api.models import MappingProfile
+from api.utils.convertors import SUPPLY_POINT_QUERY_PATH
+from api.utils.lazy_import import lazy_import
+
+
+pyparsing = lazy_import('pyparsing')
+sparql_algebra = lazy_import('rdflib.plugins.sparql.algebra')
+sparql_parser = lazy_import('rdflib.plugins.sparql.parser')
+sparql_parserutils = lazy_import('rdflib.plugins.sparql.parserutils')
+
+MAPPING_PROFILE_QUERY_DIR = os.path.join(
+    tempfile.gettempdir(), 'digichecks-mapping-profiles')
+XML_NAME_PATTERN = re.compile(r'[^\W\d][\w.\-]*')
+
+FX = Namespace('http://sparql.xyz/facade-x/ns/')
+SPARQL_ANYTHING_SERVICE = URIRef('x-sparql-anything:')
+URI_VARIABLE = Variable('_uri')
+# The options a profile query may set, besides fx:location ?_uri. Options
+# like fx:command or fx:content, or a location of its own, would let a query
+# run commands or read any file or URL from the server.
+ALLOWED_SPARQL_ANYTHING_OPTIONS = frozenset((
+    FX['blank-nodes'],
+    FX['null-string'],
+    FX['trim-strings'],
+    FX.namespace,
+    FX.root,
+    FX.slice,
+))
+SPARQL_ANYTHING_PROPERTIES = frozenset((FX.anySlot,))
+
+
+# A mapping profile that is ready to convert, the construct query is
+# written to disk once, so the JVM and the workers can read it by path
+@dataclass(frozen=True)
+class CompiledMappingProfile:
+    col_mapping: Dict[str,str]
+    namespaces: Dict[str,str]
+    query_path: str
+
+
+_compiled_profiles: Dict[Tuple[str, str], CompiledMappingProfile] = {}
+_compiled_profiles_lock = threading.Lock()
+
+
+def _validate_col_mapping(col_mapping: Dict[str,str]):
+    # The mapped names become the XML element names of every row
+    invalid = [
+        name for name in col_mapping.values()
+        if not XML_NAME_PATTERN.fullmatch(name) or name.lower().startswith('xml')
+    ]
+    if invalid:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f'Column mapping contains invalid element names: {", ".join(invalid)}'
+        )
+
+
+def _query_services(node, services: List)->List:
+    # The SERVICE patterns of the query algebra. Their inner patterns are
+    # left untranslated by rdflib, so they are translated here to find the
+    # services nested in them.
+    if isinstance(node, sparql_parserutils.CompValue):
+        if node.name == 'ServiceGraphPattern':
+            inner = sparql_algebra.translateGroupGraphPattern(node.graph)
+            services.append((node.term, _query_triples(inner, [])))
+            _query_services(inner, services)
+            return services
+        for value in node.values():
+            _query_services(value, services)
+    elif isinstance(node, (list, tuple)):
+        for value in node:
+            _query_services(value, services)
+    return services
+
+
+def _query_triples(node, triples: List)->List:
+    # The triple patterns of a pattern, without those of nested services
+    if isinstance(node, sparql_parserutils.CompValue):
+        if node.name == 'ServiceGraphPattern':
+            return triples
+        if node.name == 'BGP':
+            triples.extend(node.triples)
+        elif node.name == 'TriplesBlock':
+            triples.extend(sparql_algebra.triples(node.triples))
+        for value in node.values():
+            _query_triples(value, triples)
+    elif isinstance(node, (list, tuple)):
+        for value in node:
+            _query_triples(value, triples)
+    return triples
+
+
+def _predicate_iris(predicate)->List[URIRef]:
+    # The IRIs of a predicate, which can be a property path
+    if isinstance(predicate, URIRef):
+        return [predicate]
+    if isinstance(predicate, Path):
+        parts = getattr(predicate, 'args', None) or [
+            getattr(predicate, 'arg', None) or getattr(predicate, 'path', None)]
+        return [iri for part in parts for iri in _predicate_iris(part)]
+    return []
+
+
+def _validate_construct_query(construct_query: str):
+    def invalid(detail: str)->HTTPException:
+        return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+    try:
+        parsed_query = sparql_parser.parseQuery(construct_query)
+    except (pyparsing.ParseBaseException, RecursionError) as e:
+        raise invalid(f'Construct query could not be parsed: {e}')
+
+    if parsed_query[1].name != 'ConstructQuery':
+        raise invalid('Mapping profile query must be a CONSTRUCT query')
+    if parsed_query[1].datasetClause:
+        raise invalid('Construct query must not load graphs with FROM')
+
+    try:
+        query = sparql_algebra.translateQuery(parsed_query)
+    except Exception as e:
+        raise invalid(f'Construct query could not be parsed: {e}')
+
+    # SPARQL Anything reads options from the patterns in and outside of a
+    # SERVICE. All of them only read the converted spreadsheet.
+    scopes = [(None, _query_triples(query.algebra, []))] + _query_services(query.algebra, [])
+    locations = 0
+    for service, triples in scopes:
+        if service is not None and service != SPARQL_ANYTHING_SERVICE:
+            raise invalid(f'Construct query must only use SERVICE <{SPARQL_ANYTHING_SERVICE}>')
+
+        service_locations = 0
+        for subject, predicate, obj in triples:
+            if subject == FX.properties and predicate == FX.location and obj == URI_VARIABLE:
+                service_locations += 1
+            elif subject == FX.properties or FX.properties in (predicate, obj):
+                if predicate not in ALLOWED_SPARQL_ANYTHING_OPTIONS or not isinstance(obj, Literal):
+                    raise invalid(f'Construct query sets an unsupported option: {predicate} {obj}')
+            elif any(
+                    iri.startswith(FX) and iri not in SPARQL_ANYTHING_PROPERTIES
+                    for iri in _predicate_iris(predicate)):
+                raise invalid(f'Construct query uses an unsupported property: {predicate}')
+
+        if service is not None and service_locations != 1:
+            raise invalid('Every SERVICE must read the spreadsheet with fx:location ?_uri')
+        locations += service_locations
+
+    if not locations:
+        raise invalid('Construct query must read the spreadsheet from ?_uri')
+
+
+def _write_construct_query(construct_query: str)->str:
+    _validate_construct_query(construct_query)
+
+    # Content addressed, so identical queries share a file and a changed
+    # query never overwrites a file that a running conversion reads
+    digest = hashlib.sha256(construct_query.encode()).hexdigest()
+    query_path = os.path.join(MAPPING_PROFILE_QUERY_DIR, f'{digest}.sparql')
+    if not os.path.exists(query_path):
+        os.makedirs(MAPPING_PROFILE_QUERY_DIR, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            'w', encoding='utf-8', dir=MAPPING_PROFILE_QUERY_DIR, delete=False
+        ) as query_file:
+            query_file.write(construct_query)
+        os.replace(query_file.name, query_path)
+
+    return query_path
+
+
+def compile_mapping_profile(
+        col_mapping: Dict[str,str],
+        namespaces: Dict[str,str],
+        construct_query: str=None
+)->CompiledMappingProfile:
+    _validate_col_mapping(col_mapping)
+
+    if construct_query:
+        query_path = _write_construct_query(construct_query)
+    else:
+        query_path = SUPPLY_POINT_QUERY_PATH
+
+    return CompiledMappingProfile(
+        col_mapping=dict(col_mapping),
+        namespaces=dict(namespaces or {}),
+        query_path=query_path
+    )
+
+
+def get_compiled_mapping_profile(db_profile: MappingProfile)->CompiledMappingProfile:
+    # Compiled once per version of the profile, an update changes the key
+    key = (db_profile.uuid, str(db_profile.updated_at))
+    compiled_profile = _compiled_profiles.get(key)
+    if compiled_profile is not None and os.path.exists(compiled_profile.query_path):
+        return compiled_profile
+
+    compiled_profile = compile_mapping_profile(
+        col_mapping=db_profile.col_mapping,
+        namespaces=db_profile.namespaces,
+        construct_query=db_profile.construct_query
+    )
+    with _compiled_profiles_lock:
+        for cached_key in [k for k in _compiled_profiles if k[0] == db_profile.uuid]:
+            del _compiled_profiles[cached_key]
+        _compiled_profiles[key] = compiled_profile
+
+    return compiled_profile
+
+
+def evict_compiled_mapping_profile(profile_uuid: str):
+    with _compiled_profiles_lock:
+        for cached_key in [k for k in _compiled_profiles if k[0] == profile_uuid]:
+            del _compiled_profiles[cached_key]
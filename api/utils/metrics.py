@@ -0,0 +1,111 @@
+from contextlib import contextmanager
+import os
+import time
+
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from api.utils.profiling import profile_stage
+from api.utils.tracing import trace_span
+
+
+# With PROMETHEUS_MULTIPROC_DIR set, every gunicorn worker writes its samples
+# to that directory and a scrape of any worker aggregates all of them
+MULTIPROCESS = bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+
+STAGE_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0
+)
+
+REQUEST_DURATION = Histogram(
+    'digichecks_request_duration_seconds',
+    'Duration of HTTP requests until the response is sent',
+    ['method', 'route', 'status'],
+    buckets=STAGE_BUCKETS
+)
+STAGE_DURATION = Histogram(
+    'digichecks_stage_duration_seconds',
+    'Duration of the stages of the conversion and validation pipeline',
+    ['stage'],
+    buckets=STAGE_BUCKETS
+)
+VALIDATIONS = Counter(
+    'digichecks_validations_total',
+    'SHACL validations by result',
+    ['result']
+)
+CACHE_REQUESTS = Counter(
+    'digichecks_cache_requests_total',
+    'Cache lookups by cache and result',
+    ['cache', 'result']
+)
+VALIDATIONS_IN_PROGRESS = Gauge(
+    'digichecks_validations_in_progress',
+    'SHACL validations that are running',
+    multiprocess_mode='livesum'
+)
+
+
+@contextmanager
+def observe_stage(stage: str):
+    # Timed in the stage histogram and as a span of the request trace, and
+    # profiled when the request is profiled
+    with trace_span(stage), profile_stage(), STAGE_DURATION.labels(stage=stage).time():
+        yield
+
+
+def record_validation(conforms: bool):
+    VALIDATIONS.labels(result='conforms' if conforms else 'fails').inc()
+
+
+def record_cache_lookup(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache=cache, result='hit' if hit else 'miss').inc()
+
+
+def generate_metrics()->bytes:
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+# Times every request by its route template, so /check/{check_uuid} is one
+# series and not one per check. A plain ASGI middleware, so streaming
+# responses are timed until their last chunk.
+class RequestMetricsMiddleware:
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get('route')
+            REQUEST_DURATION.labels(
+                method=scope['method'],
+                route=route.path if route is not None else 'unmatched',
+                status=str(status_code)
+            ).observe(time.perf_counter() - start)
@@ -0,0 +1,61 @@
+import base64
+import binascii
+from typing import Callable, List, Optional, Sequence, TypeVar
+
+from fastapi import HTTPException, Query, Response, status
+
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+T = TypeVar('T')
+
+
+def encode_cursor(internal_id: int)->str:
+    return base64.urlsafe_b64encode(str(internal_id).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str)->int:
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(cursor + padding).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='Invalid cursor'
+        )
+
+
+# Keyset pagination on the internal id, which is stable under inserts and
+# deletes, unlike offsets. The cursor of the next page is returned in the
+# X-Next-Cursor header, so the list responses keep their shape. Requests
+# without cursor and limit get the whole list, as before pagination.
+class PageParams:
+
+    def __init__(
+        self,
+        cursor: str = Query(
+            default=None, description='X-Next-Cursor header of the previous page'),
+        limit: Optional[int] = Query(
+            default=None, ge=1, le=MAX_PAGE_SIZE,
+            description=f'Page size, {DEFAULT_PAGE_SIZE} when only a cursor is given'),
+    ):
+        self.after_id = decode_cursor(cursor) if cursor else None
+        if limit is None and cursor:
+            limit = DEFAULT_PAGE_SIZE
+        self.limit = limit
+
+    @property
+    def fetch_limit(self)->Optional[int]:
+        # The queries fetch one row more than the limit to see if there is a
+        # next page
+        return self.limit + 1 if self.limit is not None else None
+
+    def page(
+            self, rows: Sequence[T], response: Response, get_id: Callable[[T], int]
+    )->List[T]:
+        rows = list(rows)
+        if self.limit is not None and len(rows) > self.limit:
+            rows = rows[:self.limit]
+            response.headers['X-Next-Cursor'] = encode_cursor(get_id(rows[-1]))
+        return rows
@@ -0,0 +1,29 @@
+from dataclasses import dataclass
+
+from api.dependencies.config import settings
+from api.schemas.core.application import ApplicationRole
+from api.utils.ttl_cache import TTLCache
+
+
+# What the access checks need to know about the application behind a token
+@dataclass(frozen=True)
+class Principal:
+    client_id: str
+    role: ApplicationRole
+    company_id: int
+    company_uuid: str
+
+
+# Keyed by the JWT sub, changes in other workers are picked up after the ttl
+principal_cache: TTLCache[Principal] = TTLCache(
+    maxsize=settings.PRINCIPAL_CACHE_MAX_SIZE,
+    ttl=settings.PRINCIPAL_CACHE_TTL
+)
+
+
+def invalidate_application_principal(client_id: str):
+    principal_cache.pop(str(client_id))
+
+
+def invalidate_company_principals(company_uuid: str):
+    principal_cache.pop_where(lambda principal: principal.company_uuid == company_uuid)
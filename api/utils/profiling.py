@@ -0,0 +1,164 @@
+import cProfile
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+import json
+import os
+import pstats
+import re
+import tempfile
+import threading
+import time
+from typing import List, Optional
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from api.dependencies.config import settings
+
+
+PROFILE_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+PROFILE_HEADER = 'X-Profile-Id'
+
+
+# The profiles of one request. Every stage is profiled separately and the
+# profiles are merged when the request is done. Since Python 3.12 a profiler
+# sees all threads of the process, so a profile includes whatever else the
+# worker runs during the stage.
+@dataclass
+class ProfileSession:
+    profile_id: str
+    method: str
+    path: str
+    started_at: float = field(default_factory=time.perf_counter)
+    profiles: List[cProfile.Profile] = field(default_factory=list)
+
+
+_profile_session: ContextVar[Optional[ProfileSession]] = ContextVar(
+    'profile_session', default=None)
+# Only one profiler can be active in a process (Python 3.12 raises for a
+# second one), one request is profiled at a time and its stages one by one
+_profiled_request_lock = threading.Lock()
+_profiler_lock = threading.Lock()
+
+
+def profile_dir()->str:
+    return settings.PROFILE_DIR or os.path.join(
+        tempfile.gettempdir(), 'digichecks-profiles')
+
+
+def start_profile_session(session: ProfileSession):
+    # None when another request of this worker is being profiled
+    if not _profiled_request_lock.acquire(blocking=False):
+        return None
+    return _profile_session.set(session)
+
+
+def end_profile_session(token):
+    try:
+        _profile_session.reset(token)
+    finally:
+        _profiled_request_lock.release()
+
+
+@contextmanager
+def profile_stage():
+    session = _profile_session.get()
+    # Nested stages are part of the profile of the outer stage, and stages
+    # that run next to a profiled one are not profiled on their own
+    if session is None or not _profiler_lock.acquire(blocking=False):
+        yield
+        return
+
+    try:
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiling tool, like a debugger, is active
+            profile = None
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+                session.profiles.append(profile)
+    finally:
+        _profiler_lock.release()
+
+
+def save_profile(session: ProfileSession):
+    if not session.profiles:
+        return
+
+    directory = profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    stats = pstats.Stats(*session.profiles)
+    stats.dump_stats(os.path.join(directory, f'{session.profile_id}.pstats'))
+    with open(os.path.join(directory, f'{session.profile_id}.json'), 'w') as info_file:
+        json.dump({
+            'profile_id': session.profile_id,
+            'method': session.method,
+            'path': session.path,
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'duration': time.perf_counter() - session.started_at,
+        }, info_file)
+
+    # Keep the newest profiles only
+    infos = sorted(
+        (entry for entry in os.scandir(directory) if entry.name.endswith('.json')),
+        key=lambda entry: entry.stat().st_mtime,
+        reverse=True
+    )
+    for entry in infos[settings.PROFILE_MAX_FILES:]:
+        for suffix in ('.json', '.pstats'):
+            try:
+                os.remove(entry.path[:-len('.json')] + suffix)
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles()->List[dict]:
+    directory = profile_dir()
+    if not os.path.isdir(directory):
+        return []
+
+    profiles = []
+    for entry in os.scandir(directory):
+        if entry.name.endswith('.json'):
+            try:
+                with open(entry.path) as info_file:
+                    profiles.append(json.load(info_file))
+            except (OSError, ValueError):
+                continue
+    return sorted(profiles, key=lambda profile: profile['created_at'], reverse=True)
+
+
+def get_profile_path(profile_id: str)->Optional[str]:
+    if not PROFILE_ID_PATTERN.fullmatch(profile_id):
+        return None
+    path = os.path.join(profile_dir(), f'{profile_id}.pstats')
+    return path if os.path.exists(path) else None
+
+
+# Adds the id of the stored profile to the response, also for the streamed
+# responses that routes build themselves
+class ProfileHeaderMiddleware:
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message: Message):
+            if message['type'] == 'http.response.start':
+                profile_id = scope.get('state', {}).get('profile_id')
+                if profile_id is not None:
+                    MutableHeaders(scope=message).append(PROFILE_HEADER, profile_id)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import datetime
+from typing import BinaryIO, Iterable, Iterator
+
+from api.dependencies.config import settings
+from api.schemas.app.check import DataSetType
+from api.utils.lazy_import import lazy_import
+from api.utils.metrics import observe_stage
+
+
+np = lazy_import('numpy')
+openpyxl = lazy_import('openpyxl')
+pd = lazy_import('pandas')
+pa = lazy_import('pyarrow')
+pa_csv = lazy_import('pyarrow.csv')
+pq = lazy_import('pyarrow.parquet')
+
+
+def _convert_cell(value):
+    # Integral numbers are read as int and empty cells as NaN, the same as
+    # pd.read_excel does
+    if value is None:
+        return np.nan
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _cell_kind(value)->str:
+    if value is None:
+        return 'empty'
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, int):
+        return 'int'
+    if isinstance(value, float):
+        return 'float'
+    if isinstance(value, datetime.datetime):
+        return 'datetime'
+    return 'object'
+
+
+def _column_dtype(kinds: set)->str:
+    # The dtype pd.read_excel infers for the whole column, so every chunk
+    # gives the same text whatever rows it holds
+    values = kinds - {'empty'}
+    if not values:
+        return 'float64'
+    if values <= {'int', 'float'}:
+        return 'int64' if kinds == {'int'} else 'float64'
+    if values == {'bool'}:
+        return 'bool' if kinds == {'bool'} else 'float64'
+    if values == {'datetime'}:
+        return 'datetime64[ns]'
+    return 'object'
+
+
+def _iter_excel_rows(sheet, positions: Iterable[int])->Iterator[list]:
+    empty_rows = []
+    for row in sheet.iter_rows(min_row=2, values_only=True):
+        values = [row[position] if position < len(row) else None for position in positions]
+        # Trailing empty rows are dropped, like pd.read_excel does
+        if all(value is None for value in row):
+            empty_rows.append(values)
+            continue
+        yield from empty_rows
+        empty_rows = []
+        yield values
+
+
+def iter_excel_chunks(
+        file: BinaryIO, columns: Iterable[str], chunk_size: int=None
+)->Iterator[pd.DataFrame]:
+    # Opened eagerly, so an invalid workbook fails before conversion starts
+    workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    sheet = workbook.worksheets[0]
+    header = next(sheet.iter_rows(max_row=1, values_only=True), None) or ()
+
+    # Only the mapped columns are materialized
+    positions = {
+        column: header.index(column) for column in columns if column in header
+    }
+
+    def chunks()->Iterator[pd.DataFrame]:
+        try:
+            # A first pass over the sheet finds the dtype of every column,
+            # only the kinds of values seen are kept. The text of a value
+            # also depends on the common dtype of all columns, unmapped ones
+            # included, see dataframe_columns_as_text
+            kinds = [set() for _ in header]
+            for values in _iter_excel_rows(sheet, range(len(header))):
+                for column_kinds, value in zip(kinds, values):
+                    column_kinds.add(_cell_kind(value))
+            dtypes = [_column_dtype(column_kinds) for column_kinds in kinds]
+            common_dtype = pd.DataFrame(
+                {position: pd.Series(dtype=dtype) for position, dtype in enumerate(dtypes)}
+            ).to_numpy().dtype
+
+            def to_dataframe(chunk: list)->pd.DataFrame:
+                return pd.DataFrame({
+                    column: pd.Series(
+                        [_convert_cell(values[index]) for values in chunk],
+                        dtype=dtypes[position]
+                    ).astype(common_dtype)
+                    for index, (column, position) in enumerate(positions.items())
+                }, index=range(len(chunk)))
+
+            chunk = []
+            for values in _iter_excel_rows(sheet, positions.values()):
+                chunk.append(values)
+                if len(chunk) >= (chunk_size or settings.EXCEL_CHUNK_SIZE):
+                    yield to_dataframe(chunk)
+                    chunk = []
+
+            if chunk:
+                yield to_dataframe(chunk)
+        finally:
+            workbook.close()
+
+    return chunks()
+
+
+def read_excel(
+        file: BinaryIO, columns: Iterable[str]
+)->pd.DataFrame | Iterator[pd.DataFrame]:
+    if settings.EXCEL_STREAMING:
+        return iter_excel_chunks(file, columns)
+    return pd.read_excel(file)
+
+
+def _arrow_to_dataframe(table: pa.Table)->pd.DataFrame:
+    df = table.to_pandas()
+    # Empty cells are NaN, like the pandas readers, instead of None
+    for column in df.columns[(df.dtypes == object).to_numpy()]:
+        df[column] = df[column].where(df[column].notna(), np.nan)
+    return df
+
+
+def read_csv(file: BinaryIO, columns: Iterable[str])->pd.DataFrame:
+    # The header is read first, so only the mapped columns that exist
+    # are parsed, the others are never materialized
+    position = file.tell()
+    header = pa_csv.open_csv(file).schema.names
+    file.seek(position)
+
+    convert_options = pa_csv.ConvertOptions(
+        include_columns=[column for column in columns if column in header],
+        strings_can_be_null=True
+    )
+    return _arrow_to_dataframe(pa_csv.read_csv(file, convert_options=convert_options))
+
+
+def read_parquet(file: BinaryIO, columns: Iterable[str])->pd.DataFrame:
+    parquet_file = pq.ParquetFile(file)
+    header = parquet_file.schema_arrow.names
+    table = parquet_file.read(columns=[column for column in columns if column in header])
+    return _arrow_to_dataframe(table)
+
+
+def read_data_set(
+        file: BinaryIO, data_set_type: DataSetType, columns: Iterable[str]
+)->pd.DataFrame | Iterator[pd.DataFrame]:
+    # A streamed Excel file is read while the XML is built, only opening
+    # the workbook is timed here
+    if data_set_type == DataSetType.EXCEL:
+        with observe_stage('excel_read'):
+            return read_excel(file, columns)
+    elif data_set_type == DataSetType.CSV:
+        with observe_stage('csv_read'):
+            return read_csv(file, columns)
+    elif data_set_type == DataSetType.PARQUET:
+        with observe_stage('parquet_read'):
+            return read_parquet(file, columns)
+
+    raise ValueError(f'Data set type {data_set_type.value} is not a table')
@@ -0,0 +1,290 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+import hashlib
+import threading
+from typing import Dict, FrozenSet, Iterable, Set, Tuple
+
+from fastapi import HTTPException, status
+import rdflib
+from rdflib.compare import to_canonical_graph
+from rdflib.namespace import OWL, RDF, RDFS, SH
+from rdflib.term import BNode, Node, URIRef
+
+from api.dependencies.config import settings
+from api.utils.metrics import record_cache_lookup
+
+
+# A hosted rule in its stored form: sorted N-Triples with canonical blank
+# node labels, so the same rule always has the same content hash
+@dataclass(frozen=True)
+class CanonicalRule:
+    ntriples: str
+    namespaces: Dict[str,str]
+    rule_hash: str
+    triple_count: int
+    shape_count: int
+
+
+# Predicates whose named objects are shapes that a shape uses, the shapes
+# of sh:and, sh:or and sh:xone are in lists
+SHAPE_REFERENCES = frozenset((SH.property, SH.node, SH.qualifiedValueShape, SH['not']))
+
+_rule_graphs: 'OrderedDict[Tuple[str, Tuple[Tuple[str, str], ...]], rdflib.Graph]' = OrderedDict()
+_rule_graphs_lock = threading.Lock()
+
+
+def count_shapes(graph: rdflib.Graph)->int:
+    shapes = set(graph.subjects(RDF.type, SH.NodeShape))
+    shapes.update(graph.subjects(RDF.type, SH.PropertyShape))
+    shapes.update(graph.objects(None, SH.property))
+    for target in (SH.targetClass, SH.targetNode, SH.targetSubjectsOf, SH.targetObjectsOf):
+        shapes.update(graph.subjects(target, None))
+    return len(shapes)
+
+
+def canonicalize_rule(rule: str)->CanonicalRule:
+    try:
+        graph = rdflib.Graph()
+        graph.parse(data=rule, format='turtle')
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f'Rule is not valid Turtle: {e}'
+        )
+
+    shape_count = count_shapes(graph)
+    if not shape_count:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='Rule does not contain any SHACL shapes'
+        )
+
+    lines = to_canonical_graph(graph).serialize(format='nt').splitlines()
+    ntriples = '\n'.join(sorted(line for line in lines if line)) + '\n'
+
+    # Only the prefixes declared in the rule, not the rdflib defaults
+    default_namespaces = dict(rdflib.Graph().namespaces())
+    namespaces = {
+        prefix: str(uri) for prefix, uri in graph.namespaces()
+        if default_namespaces.get(prefix) != uri
+    }
+
+    return CanonicalRule(
+        ntriples=ntriples,
+        namespaces=namespaces,
+        rule_hash=hashlib.sha256(ntriples.encode()).hexdigest(),
+        triple_count=len(graph),
+        shape_count=shape_count
+    )
+
+
+def load_canonical_rule(
+        rule_hash: str, ntriples: str, namespaces: Dict[str,str]=None)->rdflib.Graph:
+    # Parsed once per content hash and prefixes, identical rules of different
+    # checks and companies share the graph, which must not be modified
+    key = (rule_hash, tuple(sorted((namespaces or {}).items())))
+    with _rule_graphs_lock:
+        graph = _rule_graphs.get(key)
+        if graph is not None:
+            _rule_graphs.move_to_end(key)
+    record_cache_lookup('rule-graphs', graph is not None)
+    if graph is not None:
+        return graph
+
+    graph = rdflib.Graph()
+    graph.parse(data=ntriples, format='nt')
+    for prefix, uri in (namespaces or {}).items():
+        graph.bind(prefix, uri)
+
+    with _rule_graphs_lock:
+        _rule_graphs[key] = graph
+        while len(_rule_graphs) > settings.RULE_CACHE_SIZE:
+            _rule_graphs.popitem(last=False)
+
+    return graph
+
+
+
+# The named shapes of a rule version with class or predicate targets. A
+# shape whose targets select no focus node in a data graph can't report
+# anything, so it is left out of that graph's validation.
+@dataclass(frozen=True)
+class ShapeTargetIndex:
+    # False when targets can't be resolved up front (SPARQL based
+    # sh:target, or sh:rule inferring new triples), all shapes are used then
+    prunable: bool
+    class_targets: Dict[URIRef, FrozenSet[Node]]
+    predicate_targets: Dict[URIRef, FrozenSet[Node]]
+    # Every shape with a target of its own, pruned or not. Such a shape is
+    # validated for its own focus nodes, so it is never removed as a part of
+    # a shape that refers to it.
+    targeted_shapes: FrozenSet[Node]
+    # The rule graph is part of the validated data graph (ont_graph), so its
+    # own classes and predicates select focus nodes too
+    rule_classes: FrozenSet[Node]
+    rule_predicates: FrozenSet[Node]
+
+
+_shape_target_indexes: 'OrderedDict[str, ShapeTargetIndex]' = OrderedDict()
+_shape_graphs: 'OrderedDict[Tuple[str, Tuple[Tuple[str, str], ...], FrozenSet[Node]], rdflib.Graph]' = OrderedDict()
+_shape_indexes_lock = threading.Lock()
+
+
+def build_shape_target_index(graph: rdflib.Graph)->ShapeTargetIndex:
+    class_targets = {}
+    predicate_targets = {}
+    for shape in set(graph.subjects(SH.targetClass, None)):
+        class_targets[shape] = frozenset(graph.objects(shape, SH.targetClass))
+    for target in (SH.targetSubjectsOf, SH.targetObjectsOf):
+        for shape, predicate in graph.subject_objects(target):
+            predicate_targets[shape] = predicate_targets.get(shape, frozenset()) | {predicate}
+
+    # Shapes that are classes as well target their own instances
+    for shape_type in (SH.NodeShape, SH.PropertyShape):
+        for shape in graph.subjects(RDF.type, shape_type):
+            if (shape, RDF.type, RDFS.Class) in graph or (shape, RDF.type, OWL.Class) in graph:
+                class_targets[shape] = class_targets.get(shape, frozenset()) | {shape}
+
+    # Shapes with sh:targetNode are always used, the node is a focus node
+    # even when the data graph does not mention it. Blank node shapes are
+    # always used too.
+    def is_candidate(shape: Node)->bool:
+        return isinstance(shape, URIRef) and (shape, SH.targetNode, None) not in graph
+
+    targeted_shapes = set(class_targets) | set(predicate_targets)
+    targeted_shapes.update(graph.subjects(SH.targetNode, None))
+    targeted_shapes.update(graph.subjects(SH.target, None))
+
+    return ShapeTargetIndex(
+        prunable=(None, SH.target, None) not in graph and (None, SH.rule, None) not in graph,
+        class_targets={
+            shape: targets for shape, targets in class_targets.items() if is_candidate(shape)},
+        predicate_targets={
+            shape: targets for shape, targets in predicate_targets.items() if is_candidate(shape)},
+        targeted_shapes=frozenset(targeted_shapes),
+        rule_classes=frozenset(graph.objects(None, RDF.type)),
+        rule_predicates=frozenset(graph.predicates(unique=True))
+    )
+
+
+def get_shape_target_index(rule_hash: str, graph: rdflib.Graph)->ShapeTargetIndex:
+    with _shape_indexes_lock:
+        index = _shape_target_indexes.get(rule_hash)
+        if index is not None:
+            _shape_target_indexes.move_to_end(rule_hash)
+            return index
+
+    index = build_shape_target_index(graph)
+
+    with _shape_indexes_lock:
+        _shape_target_indexes[rule_hash] = index
+        while len(_shape_target_indexes) > settings.RULE_CACHE_SIZE:
+            _shape_target_indexes.popitem(last=False)
+
+    return index
+
+
+def _data_classes(data_graph: rdflib.Graph, rule_graph: rdflib.Graph, classes: Set[Node])->Set[Node]:
+    # Instances of a subclass are targeted by sh:targetClass of the class
+    classes = set(classes)
+    frontier = list(classes)
+    while frontier:
+        cls = frontier.pop()
+        for graph in (data_graph, rule_graph):
+            for super_class in graph.objects(cls, RDFS.subClassOf):
+                if super_class not in classes:
+                    classes.add(super_class)
+                    frontier.append(super_class)
+    return classes
+
+
+def _is_shape(graph: rdflib.Graph, node: Node)->bool:
+    return (
+        (node, RDF.type, SH.NodeShape) in graph
+        or (node, RDF.type, SH.PropertyShape) in graph
+        or (node, SH.property, None) in graph
+        or (node, SH.path, None) in graph
+    )
+
+
+def _shape_closure(
+        graph: rdflib.Graph, roots: Iterable[Node], kept: FrozenSet[Node]=frozenset()
+)->Set[Node]:
+    # The shapes, their blank nodes and the shapes they refer to, except the
+    # kept ones
+    closure = set(roots)
+    frontier = list(closure)
+    while frontier:
+        node = frontier.pop()
+        for predicate, obj in graph.predicate_objects(node):
+            if obj in closure or obj in kept:
+                continue
+            if isinstance(obj, BNode) or predicate in SHAPE_REFERENCES or (
+                    predicate == RDF.first and _is_shape(graph, obj)):
+                closure.add(obj)
+                frontier.append(obj)
+    return closure
+
+
+def _without_shapes(
+        graph: rdflib.Graph, shapes: FrozenSet[Node], targeted_shapes: FrozenSet[Node]
+)->rdflib.Graph:
+    # Shapes with targets of their own stay, even when only a removed shape
+    # refers to them
+    removed = _shape_closure(graph, shapes, targeted_shapes - shapes)
+
+    # A node that is still referred to from outside, like a property shape
+    # shared with a used shape, is kept with everything it refers to
+    while True:
+        shared = {
+            node for node in removed
+            if any(subject not in removed for subject in graph.subjects(None, node))
+        }
+        if not shared:
+            break
+        removed -= _shape_closure(graph, shared)
+
+    shapes_graph = rdflib.Graph()
+    for prefix, uri in graph.namespaces():
+        shapes_graph.bind(prefix, uri)
+    for triple in graph:
+        if triple[0] not in removed:
+            shapes_graph.add(triple)
+    return shapes_graph
+
+
+def select_shapes(rule_hash: str, rule_graph: rdflib.Graph, data_graph: rdflib.Graph)->rdflib.Graph:
+    index = get_shape_target_index(rule_hash, rule_graph)
+    if not index.prunable or not (index.class_targets or index.predicate_targets):
+        return rule_graph
+
+    classes = _data_classes(
+        data_graph, rule_graph, set(data_graph.objects(None, RDF.type)) | index.rule_classes)
+    predicates = set(data_graph.predicates(unique=True)) | index.rule_predicates
+
+    unused_shapes = frozenset(
+        shape for shape in set(index.class_targets) | set(index.predicate_targets)
+        if not index.class_targets.get(shape, frozenset()) & classes
+        and not index.predicate_targets.get(shape, frozenset()) & predicates
+    )
+    if not unused_shapes:
+        return rule_graph
+
+    # Data graphs of the same kind leave out the same shapes. The pruned
+    # graph keeps the prefixes of the rule graph it was made from.
+    namespaces = tuple(sorted((prefix, str(uri)) for prefix, uri in rule_graph.namespaces()))
+    key = (rule_hash, namespaces, unused_shapes)
+    with _shape_indexes_lock:
+        shapes_graph = _shape_graphs.get(key)
+        if shapes_graph is not None:
+            _shape_graphs.move_to_end(key)
+            return shapes_graph
+
+    shapes_graph = _without_shapes(rule_graph, unused_shapes, index.targeted_shapes)
+
+    with _shape_indexes_lock:
+        _shape_graphs[key] = shapes_graph
+        while len(_shape_graphs) > settings.RULE_CACHE_SIZE:
+            _shape_graphs.popitem(last=False)
+
+    return shapes_graph
@@ -0,0 +1,166 @@
+from abc import ABC, abstractmethod
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from typing import Optional
+
+from api.dependencies.config import SharedCacheBackend, settings
+from api.utils.metrics import record_cache_lookup
+
+
+logger = logging.getLogger(__name__)
+
+# Every entry starts with its expiry time, zero when it does not expire
+HEADER = struct.Struct('<d')
+
+
+def cache_key(*parts: str | bytes)->str:
+    digest = hashlib.sha256()
+    for part in parts:
+        part = part.encode() if isinstance(part, str) else part
+        digest.update(len(part).to_bytes(8, 'little'))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+# A cache of serialized values that all workers on the node share
+class SharedCache(ABC):
+
+    @abstractmethod
+    def get(self, namespace: str, key: str)->Optional[bytes]:
+        ...
+
+    @abstractmethod
+    def set(self, namespace: str, key: str, value: bytes, ttl: float=None):
+        ...
+
+
+class NullCache(SharedCache):
+
+    def get(self, namespace: str, key: str)->Optional[bytes]:
+        return None
+
+    def set(self, namespace: str, key: str, value: bytes, ttl: float=None):
+        return None
+
+
+# One file per entry, on /dev/shm by default so it lives in shared memory.
+# Entries are written to a temporary file and renamed into place, so readers
+# in other workers never see partial entries. The least recently used
+# entries are evicted when the directory grows beyond max_size.
+class DiskCache(SharedCache):
+
+    def __init__(self, directory: str, max_size: int) -> None:
+        self.directory = directory
+        self.max_size = max_size
+        self._written = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, namespace: str, key: str)->str:
+        return os.path.join(self.directory, namespace, key[:2], key)
+
+    def get(self, namespace: str, key: str)->Optional[bytes]:
+        value = self._read(self._path(namespace, key))
+        record_cache_lookup(namespace, value is not None)
+        return value
+
+    def _read(self, path: str)->Optional[bytes]:
+        try:
+            with open(path, 'rb') as entry_file:
+                with mmap.mmap(entry_file.fileno(), 0, access=mmap.ACCESS_READ) as entry:
+                    (expires_at,) = HEADER.unpack_from(entry)
+                    if expires_at and expires_at < time.time():
+                        return None
+                    value = entry[HEADER.size:]
+            # Touched on every hit, so eviction removes the least recently used
+            os.utime(path)
+        except (FileNotFoundError, ValueError, struct.error):
+            return None
+        except OSError as e:
+            logger.warning(f'Failed to read shared cache entry {path}: {e}')
+            return None
+        return value
+
+    def set(self, namespace: str, key: str, value: bytes, ttl: float=None):
+        if len(value) + HEADER.size > self.max_size:
+            return
+
+        path = self._path(namespace, key)
+        expires_at = time.time() + ttl if ttl else 0
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                dir=os.path.dirname(path), prefix='.tmp-', delete=False
+            ) as entry_file:
+                entry_file.write(HEADER.pack(expires_at))
+                entry_file.write(value)
+            os.replace(entry_file.name, path)
+        except OSError as e:
+            logger.warning(f'Failed to write shared cache entry {path}: {e}')
+            return
+
+        # The directory is only scanned after a tenth of its size is written
+        with self._lock:
+            self._written += len(value) + HEADER.size
+            if self._written < self.max_size // 10:
+                return
+            self._written = 0
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total_size = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.startswith('.tmp-'):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, os.path.join(root, name)))
+                total_size += stat.st_size
+
+        if total_size <= self.max_size:
+            return
+
+        # Evict down to 90% of the size, so the next writes don't evict again
+        entries.sort()
+        for _, size, path in entries:
+            if total_size <= self.max_size * 0.9:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def default_cache_dir()->str:
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm/digichecks-cache'
+    return os.path.join(tempfile.gettempdir(), 'digichecks-cache')
+
+
+def get_shared_cache()->SharedCache:
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            if settings.SHARED_CACHE_BACKEND == SharedCacheBackend.disk:
+                _shared_cache = DiskCache(
+                    directory=settings.SHARED_CACHE_DIR or default_cache_dir(),
+                    max_size=settings.SHARED_CACHE_MAX_SIZE
+                )
+            else:
+                _shared_cache = NullCache()
+        return _shared_cache
@@ -0,0 +1,173 @@
+from functools import lru_cache
+import json
+import os
+import queue
+import socket
+import subprocess
+import threading
+import time
+
+import requests
+
+from api.dependencies.config import settings
+
+
+UTILS_DIR = os.path.dirname(__file__)
+JAR_PATH = os.path.join(UTILS_DIR, 'sparql-anything-0.9.0.jar')
+SERVER_JAR_PATH = os.path.join(UTILS_DIR, 'sparql-anything-server-0.9.0.jar')
+ENDPOINT_PATH = 'sparql.anything'
+
+
+@lru_cache
+def load_query(query_path: str)->str:
+    with open(query_path, encoding='utf-8') as query_file:
+        return query_file.read()
+
+
+def render_query(query: str, uri: str)->str:
+    # The CLI exposes `-v uri=...` as ?_uri, the server needs it inlined
+    return query.replace('?_uri', json.dumps(uri))
+
+
+def _get_free_port()->int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+# A long-lived SPARQL Anything server, so the JVM only starts once
+class SparqlAnythingWorker:
+
+    def __init__(self, jar_path: str=SERVER_JAR_PATH) -> None:
+        self.jar_path = jar_path
+        self.process = None
+        self.port = None
+
+    @property
+    def endpoint(self)->str:
+        return f'http://127.0.0.1:{self.port}/{ENDPOINT_PATH}'
+
+    def is_alive(self)->bool:
+        return self.process is not None and self.process.poll() is None
+
+    def is_healthy(self)->bool:
+        if not self.is_alive():
+            return False
+        try:
+            resp = requests.get(self.endpoint, params={'query': 'ASK {}'}, timeout=2)
+        except requests.exceptions.RequestException:
+            return False
+        return resp.ok
+
+    def start(self):
+        self.port = _get_free_port()
+        self.process = subprocess.Popen(
+            ['java', '-jar', self.jar_path, '-p', str(self.port), '-e', ENDPOINT_PATH],
+            stdout=subprocess.DEVNULL,
+        )
+
+        deadline = time.monotonic() + settings.SPARQL_ANYTHING_STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if not self.is_alive():
+                raise RuntimeError(
+                    f'SPARQL Anything worker exited with code {self.process.returncode}')
+            if self.is_healthy():
+                return
+            time.sleep(0.25)
+
+        self.stop()
+        raise RuntimeError('SPARQL Anything worker did not become ready in time')
+
+    def stop(self):
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.process = None
+
+    def restart(self):
+        self.stop()
+        self.start()
+
+    def construct(self, query: str)->bytes:
+        resp = requests.post(
+            self.endpoint,
+            data={'query': query},
+            headers={'Accept': 'text/turtle'},
+            timeout=settings.SPARQL_ANYTHING_QUERY_TIMEOUT
+        )
+        if not resp.ok:
+            raise ValueError(f'Error running the conversion: {resp.text}')
+        return resp.content
+
+
+# Hands out the workers one job at a time, (re)starting them when needed
+class SparqlAnythingPool:
+
+    def __init__(self, size: int, jar_path: str=SERVER_JAR_PATH) -> None:
+        self.workers = [SparqlAnythingWorker(jar_path) for _ in range(size)]
+        self._idle = queue.Queue()
+        for worker in self.workers:
+            self._idle.put(worker)
+
+    def construct(self, query: str)->bytes:
+        worker = self._idle.get()
+        try:
+            # Workers are started lazily and restarted when they crashed
+            if not worker.is_alive():
+                worker.restart()
+            try:
+                return worker.construct(query)
+            except requests.exceptions.ConnectionError:
+                # The worker went down while running the query, retry once
+                worker.restart()
+                return worker.construct(query)
+            except requests.exceptions.Timeout:
+                # A hanging JVM would block every following job
+                worker.stop()
+                raise ValueError('Error running the conversion: timed out')
+        finally:
+            self._idle.put(worker)
+
+    def shutdown(self):
+        for worker in self.workers:
+            worker.stop()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_sparql_anything_pool()->SparqlAnythingPool:
+    # Created on first use, so every (forked) process gets its own workers
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SparqlAnythingPool(settings.SPARQL_ANYTHING_WORKERS)
+        return _pool
+
+
+def shutdown_sparql_anything_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+def run_sparql_anything(query_path: str, xml_path: str)->bytes:
+    if settings.SPARQL_ANYTHING_WORKERS > 0:
+        query = render_query(load_query(query_path), xml_path)
+        return get_sparql_anything_pool().construct(query)
+
+    # Without workers every conversion starts its own JVM
+    command = ['java', '-jar', JAR_PATH, '-q', query_path, '-v', f'uri={xml_path}']
+    result = subprocess.run(command, capture_output=True)
+    if result.returncode != 0:
+        raise ValueError(f'Error running the conversion: {result.stderr}')
+    return result.stdout
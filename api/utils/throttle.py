@@ -0,0 +1,50 @@
+from collections import deque
+import threading
+import time
+from typing import Deque, Dict, Hashable
+
+
+# Allows at most `limit` events per key in any window of `window` seconds,
+# in-process, so with several workers the effective limit is multiplied
+class SlidingWindowThrottle:
+
+    def __init__(self, limit: int, window: float, maxsize: int=10000) -> None:
+        self.limit = limit
+        self.window = window
+        self.maxsize = maxsize
+        self._events: Dict[Hashable, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def retry_after(self, key: Hashable)->float:
+        # The same as hit, without recording an event
+        return self.hit(key, record=False)
+
+    def hit(self, key: Hashable, record: bool=True)->float:
+        # Records an event and returns 0, or the seconds until the next
+        # event is allowed when the key is over its limit
+        if self.limit <= 0:
+            return 0
+
+        now = time.monotonic()
+        with self._lock:
+            events = self._events.pop(key, None) or deque()
+            while events and events[0] <= now - self.window:
+                events.popleft()
+
+            if len(events) >= self.limit:
+                retry_after = events[0] + self.window - now
+            else:
+                if record:
+                    events.append(now)
+                retry_after = 0
+
+            # Keys without events are dropped, checks don't fill the table
+            if not events:
+                return retry_after
+
+            # Most recently used keys are kept when the table is full
+            while len(self._events) >= self.maxsize:
+                del self._events[next(iter(self._events))]
+            self._events[key] = events
+
+        return retry_after
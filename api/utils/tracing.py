@@ -0,0 +1,206 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+import requests
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from api.dependencies.config import TracingExporter, settings
+
+
+logger = logging.getLogger(__name__)
+
+TRACEPARENT_PATTERN = re.compile(r'00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}')
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+
+
+@dataclass
+class Span:
+    name: str
+    span_id: str
+    parent_id: Optional[str]
+    start_ns: int
+    end_ns: int = 0
+    kind: int = SPAN_KIND_INTERNAL
+    attributes: Dict[str,str] = field(default_factory=dict)
+
+    @property
+    def duration_ms(self)->float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+
+@dataclass
+class Trace:
+    trace_id: str
+    parent_id: Optional[str]
+    spans: List[Span] = field(default_factory=list)
+
+
+_trace: ContextVar[Optional[Trace]] = ContextVar('trace', default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar('current_span', default=None)
+_export_executor = None
+_export_executor_lock = threading.Lock()
+
+
+def start_span(name: str, **attributes: str)->Optional[Span]:
+    # Outside a traced request this is a context variable lookup only
+    trace = _trace.get()
+    if trace is None:
+        return None
+
+    parent = _current_span.get()
+    span = Span(
+        name=name,
+        span_id=os.urandom(8).hex(),
+        parent_id=parent.span_id if parent is not None else trace.parent_id,
+        start_ns=time.time_ns(),
+        attributes=attributes
+    )
+    # Spans of worker threads are added to the same list, appends are atomic
+    trace.spans.append(span)
+    return span
+
+
+def end_span(span: Optional[Span]):
+    if span is not None:
+        span.end_ns = time.time_ns()
+
+
+@contextmanager
+def trace_span(name: str, **attributes: str)->Iterator[Optional[Span]]:
+    started_span = start_span(name, **attributes)
+    if started_span is None:
+        yield None
+        return
+
+    token = _current_span.set(started_span)
+    try:
+        yield started_span
+    finally:
+        end_span(started_span)
+        _current_span.reset(token)
+
+
+def server_timing(spans: List[Span])->str:
+    # One metric per span name, the sum of its spans and how often it ran
+    durations: Dict[str, List[float]] = {}
+    for finished_span in spans:
+        if finished_span.end_ns:
+            durations.setdefault(finished_span.name, []).append(finished_span.duration_ms)
+    return ', '.join(
+        f'{name};dur={sum(values):.1f};desc="{len(values)}x"'
+        for name, values in durations.items()
+    )
+
+
+def to_otlp(trace: Trace)->dict:
+    return {
+        'resourceSpans': [{
+            'resource': {'attributes': [
+                {'key': 'service.name', 'value': {'stringValue': settings.APP_NAME}},
+                {'key': 'service.version', 'value': {'stringValue': settings.APP_VERSION}},
+            ]},
+            'scopeSpans': [{
+                'scope': {'name': __name__},
+                'spans': [
+                    {
+                        'traceId': trace.trace_id,
+                        'spanId': exported_span.span_id,
+                        'parentSpanId': exported_span.parent_id or '',
+                        'name': exported_span.name,
+                        'kind': exported_span.kind,
+                        'startTimeUnixNano': str(exported_span.start_ns),
+                        'endTimeUnixNano': str(exported_span.end_ns),
+                        'attributes': [
+                            {'key': key, 'value': {'stringValue': str(value)}}
+                            for key, value in exported_span.attributes.items()
+                        ]
+                    }
+                    for exported_span in trace.spans if exported_span.end_ns
+                ]
+            }]
+        }]
+    }
+
+
+def export_trace(trace: Trace):
+    try:
+        if settings.TRACING_EXPORTER == TracingExporter.otlp:
+            requests.post(
+                settings.TRACING_OTLP_ENDPOINT, json=to_otlp(trace), timeout=5
+            ).raise_for_status()
+        elif settings.TRACING_EXPORTER == TracingExporter.file:
+            with open(settings.TRACING_FILE_PATH, 'a', encoding='utf-8') as trace_file:
+                trace_file.write(json.dumps(to_otlp(trace)) + '\n')
+    except Exception as e:
+        logger.warning(f'Failed to export trace {trace.trace_id}: {e}')
+
+
+def get_export_executor()->ThreadPoolExecutor:
+    # One thread, so exports never compete with the requests
+    global _export_executor
+    with _export_executor_lock:
+        if _export_executor is None:
+            _export_executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix='trace-export')
+        return _export_executor
+
+
+# Starts a trace per request, continuing the trace of a W3C traceparent
+# header, and adds the Server-Timing header to the response. Spans that end
+# after the headers are sent, like those of streamed responses, are only
+# exported.
+class TracingMiddleware:
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http' or not settings.TRACING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = None
+        for name, value in scope['headers']:
+            if name == b'traceparent':
+                traceparent = TRACEPARENT_PATTERN.fullmatch(value.decode('latin-1'))
+                break
+        trace = Trace(
+            trace_id=traceparent.group(1) if traceparent else os.urandom(16).hex(),
+            parent_id=traceparent.group(2) if traceparent else None
+        )
+        trace_token = _trace.set(trace)
+
+        request_span = start_span('total', method=scope['method'], path=scope['path'])
+        request_span.kind = SPAN_KIND_SERVER
+        span_token = _current_span.set(request_span)
+
+        async def send_wrapper(message: Message):
+            if message['type'] == 'http.response.start':
+                end_span(request_span)
+                route = scope.get('route')
+                if route is not None:
+                    request_span.attributes['route'] = route.path
+                request_span.attributes['status'] = message['status']
+                headers = MutableHeaders(scope=message)
+                headers.append('Server-Timing', server_timing(trace.spans))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            end_span(request_span)
+            _current_span.reset(span_token)
+            _trace.reset(trace_token)
+            if settings.TRACING_EXPORTER != TracingExporter.none:
+                get_export_executor().submit(export_trace, trace)
@@ -0,0 +1,63 @@
+import argparse
+import statistics
+import subprocess
+import sys
+
+
+# Measures how long a fresh worker takes to import the app, and which
+# modules take the most time, each run in a new interpreter
+IMPORT_SCRIPT = '''
+import time
+start = time.perf_counter()
+import api.main
+{warm_up}
+print(time.perf_counter() - start)
+'''
+WARM_UP = '''
+from api.utils.lazy_import import import_heavy_modules
+import_heavy_modules()
+'''
+
+
+def time_import(warm_up: bool)->float:
+    script = IMPORT_SCRIPT.format(warm_up=WARM_UP if warm_up else '')
+    result = subprocess.run(
+        [sys.executable, '-c', script], capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(count: int):
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import api.main'],
+        capture_output=True, text=True, check=True
+    )
+    # Lines are "import time: self [us] | cumulative | imported package",
+    # a package's cumulative time includes the packages it imports
+    imports = []
+    for line in result.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].strip()
+        if '.' not in name and name != 'api':
+            imports.append((int(parts[1]), name))
+    return sorted(imports, reverse=True)[:count]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the import time of the app')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    for warm_up in (False, True):
+        timings = [time_import(warm_up) for _ in range(args.runs)]
+        label = 'import api.main + heavy modules' if warm_up else 'import api.main'
+        print(
+            f'{label}: median {statistics.median(timings) * 1000:.0f} ms, '
+            f'min {min(timings) * 1000:.0f} ms over {args.runs} runs'
+        )
+
+    print('\nSlowest packages imported by api.main:')
+    for cumulative, name in slowest_imports(args.top):
+        print(f'{cumulative / 1000:8.1f} ms  {name}')
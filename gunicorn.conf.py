@@ -0,0 +1,43 @@
+import gc
+import os
+import shutil
+import tempfile
+
+
+workers = int(os.environ.get('GUNICORN_WORKERS', 4))
+worker_class = 'uvicorn.workers.UvicornWorker'
+
+# The app is imported once in the master and the workers are forked from
+# it, so they start in milliseconds and share the imported code in memory
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+# The workers write their Prometheus samples to this directory, so /metrics
+# aggregates all workers. Set before the workers import prometheus_client.
+os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR',
+    os.path.join(tempfile.gettempdir(), 'digichecks-prometheus')
+)
+
+
+def on_starting(server):
+    # Samples of a previous run would be added to the new ones
+    multiproc_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(multiproc_dir, ignore_errors=True)
+    os.makedirs(multiproc_dir, exist_ok=True)
+
+
+def when_ready(server):
+    # Runs in the master before the workers are forked. The lazily imported
+    # conversion and validation modules are imported here once, instead of
+    # on the first check in every worker. Freezing moves everything imported
+    # so far out of the garbage collector's reach, collections in the
+    # workers would otherwise write to, and so copy, the shared pages.
+    if preload_app:
+        from api.utils.lazy_import import import_heavy_modules
+        import_heavy_modules()
+        gc.freeze()
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -1 +1 @@
-gunicorn -w 4 -k uvicorn.workers.UvicornWorker api.main:app
\ No newline at end of file
+gunicorn -c gunicorn.conf.py api.main:app
\ No newline at end of file
@@ -0,0 +1,16 @@
+import os
+
+
+# The settings are read when the api package is imported, the tests don't
+# connect to a database
+for name, value in {
+    'POSTGRES_HOST': 'localhost',
+    'POSTGRES_PORT': '5432',
+    'POSTGRES_USER': 'digichecks',
+    'POSTGRES_PASSWORD': 'digichecks',
+    'DATABASE_NAME': 'digichecks',
+    'SSL_MODE': 'disable',
+    'JWT_SECRET_KEY': 'test-secret',
+    'FERNET_KEY': '0Wmp3J7YhcENBHXAvIVT4H0q8G5YqJjMaXfHmmVJw1E=',
+}.items():
+    os.environ.setdefault(name, value)
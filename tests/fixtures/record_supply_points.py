@@ -0,0 +1,104 @@
+# Records the output of supplyPointQuery.sparql for supply_points.csv, the
+# reference for the native conversion engine. Run from the repository root:
+#
+#   python -m tests.fixtures.record_supply_points
+#
+# The settings the api package needs default to the ones of the tests.
+#
+# With the SPARQL Anything jar in api/utils and java on the path the query
+# runs on the Java path. Otherwise, with --facade-x, it runs in rdflib on
+# the Facade-X triples that SPARQL Anything reads from the XML. The first
+# line of the fixture names the engine that recorded it.
+import argparse
+import os
+import re
+import sys
+import tempfile
+from xml.etree import ElementTree
+
+import pandas as pd
+from rdflib import BNode, Graph, Literal, Namespace
+from rdflib.namespace import RDF
+
+import tests.conftest  # noqa: F401, sets the settings defaults before api is imported
+from api.utils.convertors import SUPPLY_POINT_QUERY_PATH, _query_prefixes, dataframe_to_xml
+from api.utils.sparql_anything import JAR_PATH, run_sparql_anything
+
+
+FIXTURE_DIR = os.path.dirname(os.path.abspath(__file__))
+INPUT_PATH = os.path.join(FIXTURE_DIR, 'supply_points.csv')
+OUTPUT_PATH = os.path.join(FIXTURE_DIR, 'supply_points.ttl')
+
+FX = Namespace('http://sparql.xyz/facade-x/ns/')
+XYZ = Namespace('http://sparql.xyz/facade-x/data/')
+
+
+def read_supply_points()->pd.DataFrame:
+    # Cells are read as they are written, empty cells stay empty
+    return pd.read_csv(INPUT_PATH, dtype=str, keep_default_na=False)
+
+
+def col_mapping(df: pd.DataFrame)->dict:
+    return {column: f'column{position}' for position, column in enumerate(df.columns, 1)}
+
+
+def facade_x_graph(xml_path: str)->Graph:
+    # Containers are typed with their element name, their children are the
+    # rdf:_n members and the text of an element is a literal member
+    graph = Graph()
+
+    def add_element(element: ElementTree.Element)->BNode:
+        node = BNode()
+        graph.add((node, RDF.type, XYZ[element.tag]))
+        members = ([element.text] if element.text else []) + list(element)
+        for position, member in enumerate(members, 1):
+            if isinstance(member, str):
+                graph.add((node, RDF[f'_{position}'], Literal(member)))
+            else:
+                graph.add((node, RDF[f'_{position}'], add_element(member)))
+        return node
+
+    document = BNode()
+    graph.add((document, RDF.type, FX.root))
+    graph.add((document, RDF._1, add_element(ElementTree.parse(xml_path).getroot())))
+    return graph
+
+
+def run_on_facade_x(xml_path: str)->bytes:
+    with open(SUPPLY_POINT_QUERY_PATH, encoding='utf-8') as query_file:
+        query = query_file.read()
+    query = re.sub(r'SERVICE\s*<x-sparql-anything:>', '', query)
+    query = re.sub(r'fx:properties[^.]*\.', '', query)
+    return facade_x_graph(xml_path).query(query).serialize(format='turtle')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--facade-x', action='store_true',
+                        help='run the query in rdflib when the jar is not available')
+    args = parser.parse_args()
+    if not args.facade_x and not os.path.exists(JAR_PATH):
+        sys.exit(f'{JAR_PATH} not found, download it or pass --facade-x')
+
+    df = read_supply_points()
+    with tempfile.NamedTemporaryFile(suffix='.xml') as xml_file:
+        dataframe_to_xml(df, col_mapping(df)).write(xml_file)
+        xml_file.flush()
+        if args.facade_x:
+            engine = 'rdflib on the Facade-X triples of the XML'
+            turtle = run_on_facade_x(xml_file.name)
+        else:
+            engine = f'SPARQL Anything ({os.path.basename(JAR_PATH)})'
+            turtle = run_sparql_anything(SUPPLY_POINT_QUERY_PATH, xml_file.name)
+
+    graph = Graph()
+    graph.parse(data=turtle, format='turtle')
+    for prefix, uri in _query_prefixes(SUPPLY_POINT_QUERY_PATH).items():
+        graph.bind(prefix, uri, replace=True)
+    with open(OUTPUT_PATH, 'w', encoding='utf-8') as output_file:
+        output_file.write(f'# Recorded with {engine}\n')
+        output_file.write(graph.serialize(format='turtle'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+import asyncio
+from types import SimpleNamespace
+
+from fastapi import HTTPException
+import pytest
+
+from api.routers import auth_router
+from api.utils.throttle import SlidingWindowThrottle
+
+
+@pytest.fixture(autouse=True)
+def throttles(monkeypatch):
+    async def get_application(db, client_id: str):
+        return SimpleNamespace(client_id=client_id, hashed_client_secret='secret')
+
+    async def verify_client_secret(client_id: str, client_secret: str, hashed_client_secret: str):
+        return client_secret == hashed_client_secret
+
+    monkeypatch.setattr(auth_router, 'db_get_application', get_application)
+    monkeypatch.setattr(auth_router, 'verify_client_secret', verify_client_secret)
+    monkeypatch.setattr(auth_router, 'token_throttle', SlidingWindowThrottle(limit=3, window=60))
+    monkeypatch.setattr(
+        auth_router, 'failed_token_throttle', SlidingWindowThrottle(limit=2, window=60))
+
+
+def token(client_secret: str, address: str='10.0.0.1')->int:
+    request = SimpleNamespace(client=SimpleNamespace(host=address))
+    form_data = SimpleNamespace(client_id='client', client_secret=client_secret)
+    try:
+        asyncio.run(auth_router.get_token(request, form_data, db=None))
+    except HTTPException as e:
+        return e.status_code
+    return 201
+
+
+def test_failed_attempts_are_throttled_per_address():
+    assert [token('wrong') for _ in range(3)] == [401, 401, 429]
+    assert token('secret') == 429
+
+    # The client still gets tokens from another address
+    assert token('secret', address='10.0.0.2') == 201
+
+
+def test_issued_tokens_are_throttled_per_client():
+    assert [token('secret') for _ in range(4)] == [201, 201, 201, 429]
+    assert token('secret', address='10.0.0.2') == 429
@@ -0,0 +1,55 @@
+import asyncio
+import gzip
+import hashlib
+from types import SimpleNamespace
+
+from fastapi import HTTPException
+import pytest
+
+from api.dependencies.config import settings
+from api.utils.check_helpers import spool_request_body
+
+
+def request(body: bytes, chunk_size: int=7, content_encoding: str='gzip'):
+    async def stream():
+        for start in range(0, len(body), chunk_size):
+            yield body[start:start + chunk_size]
+
+    return SimpleNamespace(headers={'Content-Encoding': content_encoding}, stream=stream)
+
+
+def spool(body: bytes, **kwargs)->bytes:
+    body_file, digest = asyncio.run(spool_request_body(request(body, **kwargs)))
+    with body_file:
+        data = body_file.read()
+    assert digest == hashlib.sha256(data).hexdigest()
+    return data
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 1024])
+def test_every_gzip_member_is_decompressed(chunk_size):
+    members = [b'<a> <b> <c> .\n', b'', b'<d> <e> <f> .\n' * 100]
+
+    data = spool(b''.join(gzip.compress(member) for member in members), chunk_size=chunk_size)
+
+    assert data == b''.join(members)
+
+
+@pytest.mark.parametrize('body', [
+    gzip.compress(b'<a> <b> <c> .\n') + b'not gzip',
+    gzip.compress(b'<a> <b> <c> .\n') + gzip.compress(b'<d> <e> <f> .\n')[:-4],
+])
+def test_trailing_data_that_is_not_gzip_is_rejected(body):
+    with pytest.raises(HTTPException) as e:
+        spool(body)
+    assert e.value.status_code == 400
+
+
+def test_size_limit_applies_to_all_members(monkeypatch):
+    monkeypatch.setattr(settings, 'RDF_MAX_BODY_SIZE', 100)
+    member = gzip.compress(b'x' * 60)
+
+    assert spool(member) == b'x' * 60
+    with pytest.raises(HTTPException) as e:
+        spool(member + member)
+    assert e.value.status_code == 413
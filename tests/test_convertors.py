@@ -0,0 +1,58 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import time
+from typing import Tuple
+from xml.etree import ElementTree
+
+import pandas as pd
+from rdflib import Graph, Literal, URIRef
+from rdflib.compare import graph_diff, isomorphic, to_isomorphic
+
+from api.dependencies.config import settings
+from api.utils import convertors
+from api.utils.convertors import dataframe_to_graph
+from tests.fixtures.record_supply_points import OUTPUT_PATH, col_mapping, read_supply_points
+
+
+def test_native_engine_matches_recorded_supply_point_query_output():
+    df = read_supply_points()
+    expected = Graph().parse(OUTPUT_PATH, format='turtle')
+
+    graph = dataframe_to_graph(df, col_mapping(df), {})
+
+    _, only_native, only_expected = graph_diff(to_isomorphic(graph), to_isomorphic(expected))
+    assert isomorphic(graph, expected), (
+        f'Only native: {sorted(only_native)}\nOnly recorded: {sorted(only_expected)}')
+
+
+def test_concurrent_conversions_use_their_own_files(tmp_path, monkeypatch):
+    def fake_sparql_anything(query_path: str, xml_path: str)->bytes:
+        # Reads the input late, so conversions overlap while it is open
+        time.sleep(0.01)
+        root = ElementTree.parse(xml_path).getroot()
+        return ''.join(
+            f'<urn:row:{row.findtext("name")}> <urn:value> "{row.findtext("value")}" .\n'
+            for row in root
+        ).encode()
+
+    monkeypatch.setattr(settings, 'CONVERSION_TEMP_DIR', str(tmp_path))
+    monkeypatch.setattr(convertors, 'run_sparql_anything', fake_sparql_anything)
+
+    def convert(index: int)->Tuple[pd.DataFrame, Graph]:
+        df = pd.DataFrame({
+            'Name': [f'conversion{index}-{row}' for row in range(index % 5 + 1)],
+            'Value': [str(index * 100 + row) for row in range(index % 5 + 1)],
+        })
+        graph = convertors.convert_dataframe(
+            df, {'Name': 'name', 'Value': 'value'}, {}, query_path='unused.sparql')
+        return df, graph
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(convert, range(64)))
+
+    for df, graph in results:
+        assert set(graph) == {
+            (URIRef(f'urn:row:{name}'), URIRef('urn:value'), Literal(value))
+            for name, value in zip(df['Name'], df['Value'])
+        }
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,73 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+from fastapi import HTTPException
+import pytest
+
+import api.dependencies  # noqa: F401, api.models is only imported after it
+from api.crud.mapping_profile import db_update_mapping_profile
+from api.schemas.app.mapping_profile import MappingProfileUpdateSchema
+from api.utils.convertors import SUPPLY_POINT_QUERY_PATH
+from api.utils.mapping_profiles import _validate_construct_query
+
+
+PREFIXES = 'PREFIX fx: <http://sparql.xyz/facade-x/ns/>\n'
+READ_ROWS = 'fx:properties fx:location ?_uri ; fx:blank-nodes false . ?s ?p ?o .'
+
+
+def construct(where: str, dataset: str='')->str:
+    return PREFIXES + f'CONSTRUCT {{ ?s ?p ?o }} {dataset} WHERE {{ {where} }}'
+
+
+def test_supply_point_query_is_valid():
+    with open(SUPPLY_POINT_QUERY_PATH, encoding='utf-8') as query_file:
+        _validate_construct_query(query_file.read())
+
+
+@pytest.mark.parametrize('query', [
+    construct(f'SERVICE <x-sparql-anything:> {{ {READ_ROWS} ?s fx:anySlot ?x }}'),
+    construct(READ_ROWS),
+])
+def test_query_reading_the_spreadsheet_is_valid(query):
+    _validate_construct_query(query)
+
+
+@pytest.mark.parametrize('query', [
+    # A location of its own, literal or bound to a variable
+    construct(f'SERVICE <x-sparql-anything:> {{ {READ_ROWS} }} '
+              'SERVICE <x-sparql-anything:> { fx:properties fx:location "/app/.env" . ?s ?p ?o }'),
+    construct('BIND("/etc/passwd" AS ?location) SERVICE <x-sparql-anything:> '
+              f'{{ {READ_ROWS} fx:properties fx:location ?location }}'),
+    construct('SERVICE <x-sparql-anything:> { fx:properties fx:location ?_uri ; '
+              'fx:slice/fx:location "/etc/passwd" . ?s ?p ?o }'),
+    # Options in the service IRI, or another service
+    construct(f'SERVICE <x-sparql-anything:> {{ {READ_ROWS} }} '
+              'SERVICE <x-sparql-anything:location=/app/.env> { ?s ?p ?o }'),
+    construct(f'SERVICE <http://example.org/sparql> {{ {READ_ROWS} }}'),
+    # Options that run commands or read other content
+    construct(f'SERVICE <x-sparql-anything:> {{ {READ_ROWS} fx:properties fx:command "id" }}'),
+    construct(f'SERVICE <x-sparql-anything:> {{ {READ_ROWS} '
+              'FILTER EXISTS { fx:properties fx:content "x" } }'),
+    construct(f'SERVICE <x-sparql-anything:> {{ {READ_ROWS} }}', 'FROM <http://example.org/graph>'),
+    construct('?s ?p ?o'),
+    PREFIXES + 'SELECT * WHERE { ?s ?p ?o }',
+])
+def test_query_reading_anything_else_is_rejected(query):
+    with pytest.raises(HTTPException) as e:
+        _validate_construct_query(query)
+    assert e.value.status_code == 400
+
+
+@pytest.mark.parametrize('update, construct_query', [
+    ({'profile_name': 'renamed'}, 'CONSTRUCT {} WHERE {}'),
+    ({'construct_query': None}, None),
+])
+def test_update_sets_only_the_fields_sent(update, construct_query):
+    db_profile = SimpleNamespace(profile_name='profile', construct_query='CONSTRUCT {} WHERE {}')
+
+    asyncio.run(db_update_mapping_profile(
+        AsyncMock(), db_profile, MappingProfileUpdateSchema(**update)))
+
+    assert db_profile.profile_name == (update.get('profile_name') or 'profile')
+    assert db_profile.construct_query == construct_query
@@ -0,0 +1,30 @@
+from fastapi import Response
+
+from api.utils.pagination import DEFAULT_PAGE_SIZE, PageParams, encode_cursor
+
+
+ROWS = list(range(1, 251))
+
+
+def test_without_cursor_and_limit_returns_everything():
+    page = PageParams(cursor=None, limit=None)
+    response = Response()
+
+    assert page.fetch_limit is None
+    assert page.page(ROWS, response, lambda row: row) == ROWS
+    assert 'X-Next-Cursor' not in response.headers
+
+
+def test_limit_returns_a_page_and_the_next_cursor():
+    page = PageParams(cursor=None, limit=10)
+    response = Response()
+
+    assert page.page(ROWS[:page.fetch_limit], response, lambda row: row) == ROWS[:10]
+    assert response.headers['X-Next-Cursor'] == encode_cursor(10)
+
+
+def test_cursor_without_limit_uses_the_default_page_size():
+    page = PageParams(cursor=encode_cursor(10), limit=None)
+
+    assert page.after_id == 10
+    assert page.limit == DEFAULT_PAGE_SIZE
@@ -0,0 +1,44 @@
+import datetime
+import io
+
+import openpyxl
+import pandas as pd
+import pytest
+
+from api.utils.convertors import dataframe_to_xml
+from api.utils.readers import iter_excel_chunks
+
+
+ROWS = [
+    ['Count', 'Amount', 'Name', 'Active', 'Date', 'Unmapped'],
+    [1, 1, 'first', True, datetime.datetime(2024, 1, 1), 'a'],
+    [2, None, None, None, None, None],
+    [3, 2.5, '007', False, datetime.datetime(2024, 1, 3), 'c'],
+    [4, 3, 'last', True, None, 'd'],
+    [None, None, None, None, None, None],
+]
+
+
+def workbook(rows: list)->bytes:
+    book = openpyxl.Workbook()
+    for row in rows:
+        book.active.append(row)
+    data = io.BytesIO()
+    book.save(data)
+    return data.getvalue()
+
+
+def xml(df)->bytes:
+    columns = ROWS[0][:-1]
+    return b''.join(dataframe_to_xml(df, {column: column.lower() for column in columns}).iter_bytes())
+
+
+@pytest.mark.parametrize('rows', [ROWS, [row[:2] for row in ROWS]], ids=['mixed', 'numeric'])
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 100])
+def test_streamed_excel_gives_the_xml_of_read_excel(rows, chunk_size):
+    data = workbook(rows)
+    expected = xml(pd.read_excel(io.BytesIO(data)))
+
+    chunks = iter_excel_chunks(io.BytesIO(data), ROWS[0][:-1], chunk_size)
+
+    assert xml(chunks) == expected
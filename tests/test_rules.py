@@ -0,0 +1,86 @@
+import re
+
+import pytest
+import rdflib
+
+from api.dependencies.config import settings
+from api.utils.check_helpers import validate_data_graph
+from api.utils.rules import canonicalize_rule, load_canonical_rule, select_shapes
+
+
+PREFIXES = '''
+@prefix ex: <http://example.org/> .
+@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+@prefix sh: <http://www.w3.org/ns/shacl#> .
+@prefix xsd: <http://www.w3.org/2001/XMLSchema#> .
+'''
+
+RULE = PREFIXES + '''
+ex:Sub rdfs:subClassOf ex:Super .
+ex:NameShape a sh:PropertyShape ; sh:path ex:name ; sh:minCount 1 .
+ex:A a sh:NodeShape ; sh:targetClass ex:A ; sh:property ex:NameShape .
+ex:B a sh:NodeShape ; sh:targetClass ex:B ; sh:property ex:NameShape ;
+    sh:property [ sh:path ex:age ; sh:datatype xsd:integer ; sh:minCount 1 ] .
+ex:SuperShape a sh:NodeShape ; sh:targetClass ex:Super ;
+    sh:property [ sh:path ex:code ; sh:minCount 1 ] .
+ex:Owner a sh:NodeShape ; sh:targetSubjectsOf ex:owns ;
+    sh:and ( ex:Labelled [ sh:path ex:owns ; sh:class ex:Thing ] ) .
+ex:Labelled a sh:NodeShape ; sh:property [ sh:path ex:label ; sh:minCount 1 ] .
+ex:Missing a sh:NodeShape ; sh:targetNode ex:missing ;
+    sh:property [ sh:path ex:name ; sh:minCount 1 ] .
+ex:C a sh:NodeShape, rdfs:Class ; sh:property [ sh:path ex:zip ; sh:minCount 1 ] .
+ex:Unused a sh:NodeShape ; sh:targetClass ex:Absent ; sh:node ex:Shared .
+ex:Shared a sh:NodeShape ; sh:targetClass ex:Thing ;
+    sh:property [ sh:path ex:name ; sh:minCount 1 ] .
+'''
+
+DATA_GRAPHS = {
+    'class': 'ex:x a ex:A .',
+    'subclass': 'ex:x a ex:Sub .',
+    'subjects_of': 'ex:x a ex:A ; ex:owns ex:y .',
+    'datatype': 'ex:x a ex:B ; ex:age "x" .',
+    'implicit_class': 'ex:x a ex:C .',
+    'target_of_referenced_shape': 'ex:a a ex:Thing .',
+    'untyped': 'ex:x ex:foo 1 .',
+}
+
+
+@pytest.fixture(scope='module')
+def rule():
+    canonical_rule = canonicalize_rule(RULE)
+    graph = load_canonical_rule(
+        canonical_rule.rule_hash, canonical_rule.ntriples, canonical_rule.namespaces)
+    return canonical_rule.rule_hash, graph
+
+
+def report(results_text: str):
+    # The order of the results is not fixed
+    return sorted(re.split(r'\n(?=Constraint Violation)', results_text.strip()))
+
+
+@pytest.mark.parametrize('data', DATA_GRAPHS.values(), ids=DATA_GRAPHS.keys())
+def test_pruned_validation_matches_full_validation(rule, data, monkeypatch):
+    rule_hash, rule_graph = rule
+    data = PREFIXES + data
+
+    monkeypatch.setattr(settings, 'SHAPE_TARGET_INDEX', False)
+    full_conforms, full_results = validate_data_graph(data, rule_graph, rule_hash)
+    monkeypatch.setattr(settings, 'SHAPE_TARGET_INDEX', True)
+    pruned_conforms, pruned_results = validate_data_graph(data, rule_graph, rule_hash)
+
+    assert pruned_conforms == full_conforms
+    assert report(pruned_results) == report(full_results)
+
+
+def test_shapes_with_own_targets_are_kept(rule):
+    rule_hash, rule_graph = rule
+    data_graph = rdflib.Graph().parse(
+        data=PREFIXES + DATA_GRAPHS['target_of_referenced_shape'], format='turtle')
+
+    shapes_graph = select_shapes(rule_hash, rule_graph, data_graph)
+
+    ex = rdflib.Namespace('http://example.org/')
+    assert len(shapes_graph) < len(rule_graph)
+    assert (ex.Unused, None, None) not in shapes_graph
+    assert (ex.Shared, rdflib.SH.targetClass, ex.Thing) in shapes_graph
+    assert (ex.Missing, rdflib.SH.targetNode, ex.missing) in shapes_graph